@@ -1,29 +1,204 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
 import sys
+import copy
 import numpy as np
 
 
+# string columns stored as integer codes into a table of labels
+CATEGORICAL_COLUMNS = ("Tag", "Antenna", "Address")
+
+
 class DataBase(object):
 
-    def __init__(self, data, mask):
+    def __init__(self, data, mask, categories=None):
+        """
+        Args:
+           data: structured array
+           mask: a list or tuple of floats (time bounds to cut the data)
+           categories: dictionary column -> table of labels
+             If given, columns listed in categories hold codes into these
+             tables (e.g. data and tables returned by encoded()).
+        """
         self.mask = None
         self._mask_slice = None
-        self.data = data
+        self._sorted_columns = {}
+        if categories is None:
+            self.data = data
+        else:
+            self._set_codes(data, categories)
         if mask:
             self._cut_out_data(mask)
+        self._index_tags()
+
+    @property
+    def data(self):
+        """Structured array with all the data (string columns decoded).
+        The array is decoded on every access, so use column(),
+        getproperty or encoded() to read only the necessary parts
+        of the data. The array is read-only -- data is stored as codes,
+        so changes to the decoded array could not be stored. To change
+        the data, set a new array (self.data = new_data)."""
+        out = np.empty(len(self._data), dtype=self._dtype)
+        for name in self._dtype.names:
+            out[name] = self._column(name, decode=True)
+        out.flags.writeable = False
+        return out
+
+    @data.setter
+    def data(self, data):
+        """Store data with columns listed in CATEGORICAL_COLUMNS replaced
+        by codes (positions in a sorted table of labels of the column)."""
+        data = np.asarray(data)
+        categories = {}
+        codes = {}
+        for name in data.dtype.names:
+            if name not in CATEGORICAL_COLUMNS:
+                continue
+            labels, inverse = np.unique(data[name], return_inverse=True)
+            code_type = np.min_scalar_type(-max(len(labels), 1))
+            categories[name] = labels
+            codes[name] = inverse.ravel().astype(code_type)
+        dtype = [(name, codes[name].dtype if name in codes
+                  else data.dtype[name]) for name in data.dtype.names]
+        coded = np.empty(len(data), dtype=dtype)
+        for name in data.dtype.names:
+            coded[name] = codes.get(name, data[name])
+        self._set_codes(coded, categories)
+
+    def _set_codes(self, data, categories):
+        """Store data with columns listed in categories given as codes
+        into tables of labels. Labels, which are not used by the data,
+        are removed from the tables."""
+        self._categories = {}
+        for name, labels in categories.items():
+            labels = np.asarray(labels)
+            used = np.bincount(data[name], minlength=len(labels)) > 0
+            if not used.all():
+                if not data.flags.owndata or not data.flags.writeable:
+                    data = data.copy()
+                data[name] = (np.cumsum(used) - 1)[data[name]]
+                labels = labels[used]
+            self._categories[name] = labels
+        self._dtype = np.dtype([(name, self._categories[name].dtype
+                                 if name in self._categories
+                                 else data.dtype[name])
+                                for name in data.dtype.names])
+        self._data = data
+        self._sorted_columns = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def _column(self, name, decode=False):
+        """Return column name of the stored data. Categorical columns
+        are returned as codes unless decode is True."""
+        column = self._data[name]
+        if decode and name in self._categories:
+            return self._categories[name][column]
+        return column
+
+    def column(self, propname, codes=False):
+        """Return all the values of column propname (not clipped by
+        the mask) as an array. Categorical columns are decoded, unless
+        codes is True."""
+        return self._column(propname, decode=not codes)
+
+    def encoded(self):
+        """Return the stored data (a read-only structured array with
+        categorical columns given as codes, not clipped by the mask)
+        and a dictionary column -> table of labels (see categories).
+        DataBase(*self.encoded()) stores the same data."""
+        data = self._data.view()
+        data.flags.writeable = False
+        return data, dict(self._categories)
+
+    def categories(self, propname):
+        """Return the (sorted) table of labels of a categorical column.
+        Code i of column propname corresponds to categories(propname)[i].
+        """
+        return self._categories[propname]
+
+    def encode(self, propname, values):
+        """Return codes of values of categorical column propname
+        as an int array. Values not found in the data get code -1."""
+        codes = {label: i for i, label
+                 in enumerate(self._categories[propname].tolist())}
+        if np.ndim(values) == 0:
+            values = [values]
+        return np.array([codes.get(value, -1) for value in values],
+                        dtype=int)
+
+    def _index_tags(self):
+        """Index rows of self.data by animal tag. Row numbers of every tag
+        are stored (in increasing order) in one array, and tag_bounds
+        point to the part of this array that belongs to a tag."""
+        tags = self._column("Tag")
+        self._tag_rows = np.argsort(tags, kind="stable")
+        self._columns_by_tag = {}
+        labels = self._categories["Tag"]
+        bounds = np.searchsorted(tags[self._tag_rows],
+                                 np.arange(len(labels) + 1))
+        self._tag_bounds = {tag: (bounds[i], bounds[i + 1])
+                            for i, tag in enumerate(labels.tolist())}
+
+    def _column_by_tag(self, propname):
+        """Return column propname (codes for categorical columns)
+        with rows grouped by tag (as in self._tag_rows). The cached
+        column is read-only, so views returned by queries can not
+        modify it."""
+        if propname not in self._columns_by_tag:
+            column = self._column(propname)[self._tag_rows]
+            column.flags.writeable = False
+            self._columns_by_tag[propname] = column
+        return self._columns_by_tag[propname]
+
+    def _tag_slice(self, mouse):
+        """Return part of self._tag_rows with rows of mouse clipped
+        by the mask."""
+        start, end = self._tag_bounds.get(mouse, (0, 0))
+        if self.mask is not None:
+            rows = self._tag_rows[start:end]
+            mask_0, mask_1 = self._mask_slice[0], self._mask_slice[1]
+            start, end = (start + np.searchsorted(rows, mask_0),
+                          start + np.searchsorted(rows, mask_1))
+        return start, end
+
+    def _rows(self, mice):
+        """Return row numbers of registrations (visits) of mice
+        in the order of self.data, clipped by the mask."""
+        rows = []
+        for mouse in set(mice):
+            start, end = self._tag_slice(mouse)
+            rows.append(self._tag_rows[start:end])
+        if not rows:
+            return np.array([], dtype=int)
+        return np.sort(np.concatenate(rows))
+
+    def _is_sorted(self, column_name):
+        if column_name not in self._sorted_columns:
+            arr = self._column(column_name)
+            self._sorted_columns[column_name] = bool(np.all(arr[1:] >=
+                                                            arr[:-1]))
+        return self._sorted_columns[column_name]
 
     def _find_mask_indices(self, mask, column_name):
-        arr = np.array(self.data[column_name])
+        arr = self._column(column_name)
 
         if len(mask) >= 2:
             starttime = mask[0]
             endtime = mask[-1]
-        elif len(args) == 1:
-            starttime = min(self.data[column_name])
+        elif len(mask) == 1:
+            starttime = min(arr)
             endtime = mask[0]
         else:
             return (0, len(arr) - 1)
+        if self._is_sorted(column_name):
+            first = np.searchsorted(arr, starttime, side="left")
+            last = np.searchsorted(arr, endtime, side="left")
+            if first < last:
+                return (first, last)
+            return (0, 0)
         idcs = np.where((arr >= starttime) & (arr < endtime))[0]
         if len(idcs) >= 2:
             return (idcs[0], idcs[-1] + 1)
@@ -35,10 +210,10 @@ class DataBase(object):
         """mask_data(endtime) or mask_data(starttime, endtime)
         All future queries will be clipped to the visits starting between
         starttime and endtime."""
-        arr = np.array(self.data[column_name])
+        arr = self._column(column_name)
         if isinstance(args, int) or isinstance(args, float):
             start = min(arr)
-            end = args[0]
+            end = args
         elif len(args) >= 2:
             start = args[0]
             end = args[-1]
@@ -53,47 +228,99 @@ class DataBase(object):
         self._mask_slice = self. _find_mask_indices(self.mask,
                                                     column_name)
 
+    def window(self, start, end, column_name):
+        """Return a view of the data clipped to entries with column_name
+        between start and end. The view shares data with the original
+        object, which stays unmasked, so views of different time windows
+        can be queried at the same time."""
+        view = copy.copy(self)
+        view.mask = (start, end)
+        view._mask_slice = self._find_mask_indices(view.mask, column_name)
+        return view
+
+    def unmasked(self):
+        """Return a view of all the data, which is not clipped by the mask.
+        The mask of the original object does not change."""
+        if self.mask is None:
+            return self
+        view = copy.copy(self)
+        view.mask = None
+        view._mask_slice = None
+        return view
+
     def unmask_data(self):
         """Remove the mask - future queries will not be clipped"""
         self.mask = None
         self._mask_slice = None
 
-    def _cut_out_data(self, new_mask):
-        mask = self._find_mask_indices(new_mask)
-        for key in self.data.keys():
-            self.data[key] = self.data[key][mask[0]: mask[1]]
+    def _cut_out_data(self, new_mask, column_name):
+        """Remove all the entries with column_name outside of new_mask."""
+        arr = self._column(column_name)
+        if len(new_mask) >= 2:
+            start, end = new_mask[0], new_mask[-1]
+        else:
+            start, end = min(arr), new_mask[0]
+        if self._is_sorted(column_name):
+            first, last = np.searchsorted(arr, [start, end], side="left")
+            data = self._data[first:max(first, last)].copy()
+        else:
+            data = self._data[(arr >= start) & (arr < end)]
+        self._set_codes(data, self._categories)
 
-    def getproperty(self, mice, propname, astype=None):
+    def getproperty_codes(self, mice, propname):
+        """Return values of propname for mice (clipped by the mask)
+        as an array, with categorical columns given as codes. For a single
+        animal the array is a read-only view of data grouped by animal
+        tag."""
         if sys.version_info < (3, 0):
             if isinstance(mice, (str, unicode)):
                 mice = [mice]
         else:
             if isinstance(mice, str):
                 mice = [mice]
+        mice = set(mice)
+        if len(mice) == 1:
+            start, end = self._tag_slice(mice.pop())
+            return self._column_by_tag(propname)[start:end]
+        return self._column(propname)[self._rows(mice)]
 
-        if self.mask is None:
-            if astype is None:
-                return [x[0] for x in zip(self.data[propname],
-                        self.data['Tag']) if x[1] in mice]
-            elif astype == 'float':
-                return [float(x[0]) for x in zip(self.data[propname],
-                        self.data['Tag']) if x[1] in mice]
+    def getproperty_array(self, mice, propname):
+        """Return values of propname for mice (clipped by the mask)
+        as an array. Numerical columns of a single animal are read-only
+        views of data grouped by animal tag."""
+        values = self.getproperty_codes(mice, propname)
+        if propname in self._categories:
+            return self._categories[propname][values]
+        return values
+
+    def get_data(self, mice):
+        """Return all the columns of rows of mice (clipped by the mask)
+        as a structured array with decoded categorical columns."""
+        if sys.version_info < (3, 0):
+            if isinstance(mice, (str, unicode)):
+                mice = [mice]
         else:
-            mask_0, mask_1 = self._mask_slice[0], self._mask_slice[1]
-            if astype is None:
-                return [x[0] for x in zip(self.data[propname][mask_0:mask_1],
-                                          self.data['Tag'][mask_0:mask_1])
-                        if x[1] in mice]
-            elif astype == 'float':
-                return [float(x[0]) for x in zip(
-                    self.data[propname][mask_0:mask_1],
-                    self.data['Tag'][mask_0:mask_1])
-                        if x[1] in mice]
+            if isinstance(mice, str):
+                mice = [mice]
+        rows = self._data[self._rows(mice)]
+        out = np.empty(len(rows), dtype=self._dtype)
+        for name in self._dtype.names:
+            if name in self._categories:
+                out[name] = self._categories[name][rows[name]]
+            else:
+                out[name] = rows[name]
+        return out
+
+    def getproperty(self, mice, propname, astype=None):
+        values = self.getproperty_array(mice, propname)
+        if astype == 'float':
+            values = values.astype(float)
+        return values.tolist()
 
 
 class Data(DataBase):
-    def __init__(self, data, mask):
-        super(Data, self).__init__(data, mask)
+    def __init__(self, data, mask, categories=None):
+        super(Data, self).__init__(data, mask, categories)
 
     def get_antennas(self, mice):
         return self.getproperty(mice, 'Antenna')
@@ -104,13 +331,31 @@ class Data(DataBase):
     def get_durations(self, mice):
         return self.getproperty(mice, 'Duration')
 
+    def get_antennas_array(self, mice):
+        return self.getproperty_array(mice, 'Antenna')
+
+    def get_times_array(self, mice):
+        return self.getproperty_array(mice, 'Time')
+
+    def get_durations_array(self, mice):
+        return self.getproperty_array(mice, 'Duration')
+
+    def get_antenna_codes(self, mice):
+        return self.getproperty_codes(mice, 'Antenna')
+
     def mask_data(self, mask):
         super(Data, self).mask_data(mask, column_name="Time")
 
+    def _cut_out_data(self, mask):
+        super(Data, self)._cut_out_data(mask, column_name="Time")
+
+    def window(self, start, end):
+        return super(Data, self).window(start, end, column_name="Time")
+
 
 class Visits(DataBase):
-    def __init__(self, data, mask):
-        super(Visits, self).__init__(data, mask)
+    def __init__(self, data, mask, categories=None):
+        super(Visits, self).__init__(data, mask, categories)
 
     def get_starttimes(self, mice):
         return self.getproperty(mice, 'AbsStartTimecode', 'float')
@@ -124,5 +369,62 @@ class Visits(DataBase):
     def get_visit_addresses(self, mice):
         return self.getproperty(mice, 'Address')
 
+    def get_starttimes_array(self, mice):
+        return self.getproperty_array(mice, 'AbsStartTimecode')
+
+    def get_endtimes_array(self, mice):
+        return self.getproperty_array(mice, 'AbsEndTimecode')
+
+    def get_durations_array(self, mice):
+        return self.getproperty_array(mice, 'VisitDuration')
+
+    def get_visit_addresses_array(self, mice):
+        return self.getproperty_array(mice, 'Address')
+
+    def get_visit_address_codes(self, mice):
+        return self.getproperty_codes(mice, 'Address')
+
     def mask_data(self, mask):
         super(Visits, self).mask_data(mask, column_name="AbsStartTimecode")
+
+    def _cut_out_data(self, mask):
+        super(Visits, self)._cut_out_data(mask,
+                                          column_name="AbsStartTimecode")
+
+    def window(self, start, end):
+        return super(Visits, self).window(start, end,
+                                          column_name="AbsStartTimecode")
+
+
+def recode(encoded):
+    """
+    Translate codes of categorical columns of datasets to common tables
+    of labels, e.g. to merge the datasets without decoding them.
+
+    Args:
+       encoded: list of pairs (structured array with codes, dictionary
+         column -> table of labels) returned by DataBase.encoded()
+         for datasets with the same columns
+    Returns:
+       a list of structured arrays with codes (one per dataset)
+       and a dictionary column -> table of labels
+    """
+    tables = [labels for data, labels in encoded]
+    categories = {}
+    for name in tables[0]:
+        categories[name] = np.unique(np.concatenate([labels[name]
+                                                     for labels in tables]))
+    out = []
+    for data, labels in encoded:
+        dtype = [(name, np.min_scalar_type(-max(len(categories[name]), 1))
+                  if name in categories else data.dtype[name])
+                 for name in data.dtype.names]
+        new = np.empty(len(data), dtype=dtype)
+        for name in data.dtype.names:
+            if name in categories:
+                translation = np.searchsorted(categories[name], labels[name])
+                new[name] = translation[data[name]]
+            else:
+                new[name] = data[name]
+        out.append(new)
+    return out, categories
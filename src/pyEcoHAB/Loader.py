@@ -4,8 +4,12 @@
 from __future__ import print_function, division, absolute_import
 import os
 import sys
+import copy
+import threading
 from datetime import date
 from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import repeat
 
 try:
     basestring
@@ -21,7 +25,8 @@ from .utils import for_loading as ufl
 
 
 class EcoHabDataBase(object):
-    def __init__(self, data, mask, visit_threshold, setup_config):
+    def __init__(self, data, mask, visit_threshold, setup_config,
+                 visits=None, n_jobs=1):
         """
         Base class for Loader and Merger providing data structure and
         methods for accessing antenna recordings and visits to Eco-HAB
@@ -32,8 +37,9 @@ class EcoHabDataBase(object):
         which describes geometry of the Eco-HAB setup used to collect data.
 
         Args:
-           data: DataBase
-             dataset read in by Loader or Merger
+           data: structured array or Data
+             dataset read in by Loader or Merger. Data is used as it is
+             (it is not cut by mask).
            mask: a list or tuple of floats
              If necessary one can provide time bounds to cut the data.
              Mask bounds have to be specified as seconds from epoch in
@@ -42,14 +48,93 @@ class EcoHabDataBase(object):
              Specify minumum duration (in sec) of visit to Eco-HAB cage.
            setup_config: SetupConfig or ExperimentSetupConfig
              Geometry of the Eco-Hab setup used to collect data.
+           visits: structured array or Visits
+             Visits calculated previously for the same dataset (e.g. read
+             in from a cache). By default visits are calculated.
+           n_jobs: int
+             number of worker processes calculating visits of different
+             animals. -1 uses all available CPUs. By default visits are
+             calculated serially.
         """
-        self.registrations = BaseFunctions.Data(data, mask)
+        self.n_jobs = n_jobs
+        self._diagnostics = None
+        self._pending_diagnostics = None
+        self._diagnostics_thread = None
+        self.diagnostics_future = None
+        # per-interval co-location results of incohort_sociability
+        self._colocation_cache = {}
+        if isinstance(data, BaseFunctions.Data):
+            self.registrations = data
+        else:
+            self.registrations = BaseFunctions.Data(data, mask)
         self.threshold = visit_threshold
         self.mice = self.get_mice()
-        self.visits = self._calculate_visits(setup_config)
+        if visits is None:
+            self.visits = self._calculate_visits(setup_config)
+        elif isinstance(visits, BaseFunctions.Visits):
+            self.visits = visits
+        else:
+            self.visits = BaseFunctions.Visits(visits, None)
         self.session_start = sorted(self.get_times(self.mice))[0]
         self.session_end = sorted(self.get_times(self.mice))[-1]
 
+    def _start_diagnostics(self, mode, function, *args):
+        """Calculate diagnostics (function(*args)) now ("now"), in
+        a background thread ("background") or on the first access
+        of self.diagnostics ("lazy"). Every background calculation
+        runs in its own thread, which waits for the previous background
+        calculation to finish."""
+        self._pending_diagnostics = None
+        self.diagnostics_future = None
+        if mode == "now":
+            self._diagnostics = function(*args)
+        elif mode == "background":
+            future = Future()
+            thread = threading.Thread(target=self._background_diagnostics,
+                                      args=(self._diagnostics_thread, future,
+                                            function, args))
+            self._diagnostics_thread = thread
+            self.diagnostics_future = future
+            thread.start()
+        elif mode == "lazy":
+            self._pending_diagnostics = (function, args)
+        else:
+            raise Exception("Unknown diagnostics mode %s" % mode)
+
+    def _background_diagnostics(self, previous, future, function, args):
+        """Run function(*args) after thread previous has finished and
+        store the result (or the exception raised) in future."""
+        if previous is not None:
+            previous.join()
+        if future.set_running_or_notify_cancel():
+            try:
+                result = function(*args)
+            except Exception as e:
+                print("Calculating diagnostics failed:", repr(e))
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        if self._diagnostics_thread is threading.current_thread():
+            self._diagnostics_thread = None
+
+    @property
+    def diagnostics(self):
+        """
+        Texts of diagnostics of antenna registrations (returned by
+        run_diagnostics and saved in the diagnostics directory in
+        results). Waits for background diagnostics to finish or
+        calculates lazy diagnostics, if necessary. Exceptions raised
+        by background diagnostics are raised here.
+        """
+        if self.diagnostics_future is not None:
+            self._diagnostics = self.diagnostics_future.result()
+            self.diagnostics_future = None
+        elif self._pending_diagnostics is not None:
+            function, args = self._pending_diagnostics
+            self._diagnostics = function(*args)
+            self._pending_diagnostics = None
+        return self._diagnostics
+
     def _calculate_animal_positions(self, setup_config):
         """Calculate timings of animal visits to Eco-HAB compartments, using
         a modified algorithm by Alicja Puscian and Szymon Leski. Main
@@ -81,12 +166,90 @@ class EcoHabDataBase(object):
         tempdata.sort(key=lambda x: x[2])
         return tempdata
 
+    def _animal_positions(self, mouse, times, antennas, setup_config):
+        """Calculate visits of mouse with the vectorized position algorithm
+        (utils.get_animal_position_array).
+
+        Returns:
+           structured array
+        """
+        return utils.get_animal_position_array(times, antennas, mouse,
+                                               self.threshold,
+                                               setup_config.topology)
+
+    def _sort_visits(self, visits):
+        """Concatenate visits of all animals and sort them by start time."""
+        if not len(visits):
+            return np.array([], dtype=utils.VISITS_DTYPE)
+        data = np.concatenate(visits)
+        return data[np.argsort(data["AbsStartTimecode"], kind="stable")]
+
+    def _update_animal_positions(self, old_registrations, setup_config):
+        """Calculate timings of animal visits after new registrations have
+        been appended to old_registrations. For every animal
+        the position algorithm is rerun only from the last registration,
+        which can be influenced by the new registrations. If new
+        registrations of an animal precede its old registrations, its
+        visits are calculated from scratch.
+
+        Args:
+           old_registrations: Data
+             registrations used to calculate self.visits
+           setup_config: ExperimentSetupConfig or SetupConfig
+        Returns:
+           structured array
+        """
+        visits = []
+        old_visits = self.visits.unmasked()
+        for mouse in self.mice:
+            times, antennas = utils.get_times_antennas_arrays(
+                self.registrations, mouse, 0, -1)
+            old_times, old_antennas = utils.get_times_antennas_arrays(
+                old_registrations, mouse, 0, -1)
+            n_old = len(old_times)
+            if (np.array_equal(times[:n_old], old_times) and
+                    np.array_equal(antennas[:n_old], old_antennas)):
+                start, n_discard = utils.get_position_resume_index(
+                    old_antennas.tolist(),
+                    setup_config.topology.internal_antennas)
+                out = old_visits.get_data(mouse)
+                visits.append(out[:len(out) - n_discard])
+            else:
+                start = 0
+            visits.append(self._animal_positions(mouse, times[start:],
+                                                 antennas[start:],
+                                                 setup_config))
+        return self._sort_visits(visits)
+
+    def _append_registrations(self, data, setup_config):
+        """Append new registrations and extend visits.
+
+        Args:
+           data: Data
+             new registrations
+           setup_config: SetupConfig or ExperimentSetupConfig
+        """
+        old_registrations = self.registrations.unmasked()
+        datasets, categories = BaseFunctions.recode(
+            [old_registrations.encoded(), data.encoded()])
+        all_data = ufl.merge_sorted(datasets, "Time")
+        self.registrations = BaseFunctions.Data(all_data, None, categories)
+        self.mice = self.get_mice()
+        visits = self._update_animal_positions(old_registrations,
+                                               setup_config)
+        self.visits = BaseFunctions.Visits(visits, None)
+        self._colocation_cache = {}
+        self.session_start = sorted(self.get_times(self.mice))[0]
+        self.session_end = sorted(self.get_times(self.mice))[-1]
+
     def _calculate_visits(self, setup_config):
         """Calculate EcoHabBase.visits. Calculate timings of animal visits to
         Eco-HAB compartments, using a modified algorithm by Alicja
         Puscian and Szymon Leski. Main modification -- if there are
         internal atennas in cages, registrations from internal antennas
         override other registrations when specifying animal location.
+        Visits are calculated with the vectorized version of the algorithm
+        (the same visits as _calculate_animal_positions).
 
         Args:
            setup_config: ExperimentSetupConfig or SetupConfig
@@ -94,9 +257,26 @@ class EcoHabDataBase(object):
            visits to Eco-HAB cages: Visits
 
         """
-        temp_data = self._calculate_animal_positions(setup_config)
-        data = ufl.transform_visits(temp_data)
-        return BaseFunctions.Visits(data, None)
+        times = []
+        antennas = []
+        for mouse in self.mice:
+            m_times, m_antennas = utils.get_times_antennas_arrays(
+                self.registrations, mouse, 0, -1)
+            times.append(m_times)
+            antennas.append(m_antennas)
+        n_jobs = min(ufl.get_n_jobs(self.n_jobs), len(self.mice))
+        if n_jobs <= 1:
+            visits = [self._animal_positions(mouse, times[i], antennas[i],
+                                             setup_config)
+                      for i, mouse in enumerate(self.mice)]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                visits = list(executor.map(
+                    utils.get_animal_position_array,
+                    times, antennas, self.mice,
+                    repeat(self.threshold),
+                    repeat(setup_config.topology)))
+        return BaseFunctions.Visits(self._sort_visits(visits), None)
 
     def mask_data(self, start_time, end_time):
         """
@@ -118,6 +298,41 @@ class EcoHabDataBase(object):
         self.registrations.unmask_data()
         self.visits.unmask_data()
 
+    def window(self, start_time, end_time):
+        """
+        Return a view of the data with registrations and visits clipped
+        to (start_time, end_time), as after mask_data(start_time, end_time).
+        The view shares registrations and visits with the original object,
+        which is not masked, so views of different time windows can be
+        used at the same time. The view does not share cached results
+        of analyses with the original object.
+
+        Args:
+           start_time: float
+           end_time: float
+        Returns:
+           a view of the data (the same class as the original object)
+        """
+        view = copy.copy(self)
+        view._colocation_cache = {}
+        view.mask = (start_time, end_time)
+        view.registrations = self.registrations.window(start_time, end_time)
+        view.visits = self.visits.window(start_time, end_time)
+        return view
+
+    def unmasked(self):
+        """
+        Return a view of all the registrations and visits, which are not
+        clipped by the mask (as after unmask_data). The mask of the
+        original object does not change.
+        """
+        view = copy.copy(self)
+        view._colocation_cache = {}
+        view.mask = None
+        view.registrations = self.registrations.unmasked()
+        view.visits = self.visits.unmasked()
+        return view
+
     def get_antennas(self, mice):
         return self.registrations.getproperty(mice,
                                          'Antenna')
@@ -153,12 +368,39 @@ class EcoHabDataBase(object):
                                        'VisitDuration',
                                        'float')
 
+    def get_antennas_array(self, mice):
+        """Return antennas registering specified animals as an array
+        (a view of the data, which should not be modified)."""
+        return self.registrations.get_antennas_array(mice)
+
+    def get_times_array(self, mice):
+        """Return registration times of specified animals as an array
+        (a view of the data, which should not be modified)."""
+        return self.registrations.get_times_array(mice)
+
+    def get_durations_array(self, mice):
+        """Return durations of registrations of specified animals as
+        an array (a view of the data, which should not be modified)."""
+        return self.registrations.get_durations_array(mice)
+
+    def get_visit_addresses_array(self, mice):
+        return self.visits.get_visit_addresses_array(mice)
+
+    def get_starttimes_array(self, mice):
+        return self.visits.get_starttimes_array(mice)
+
+    def get_endtimes_array(self, mice):
+        return self.visits.get_endtimes_array(mice)
+
+    def get_visit_durations_array(self, mice):
+        return self.visits.get_durations_array(mice)
+
     def how_many_antennas(self):
         all_antennas = set(self.get_antennas(self.mice))
         return len(all_antennas)
 
     def get_mice(self):
-        mouse_list = list(set(self.registrations.data["Tag"]))
+        mouse_list = self.registrations.categories("Tag").tolist()
         # new Eco-HAB has a different mouse tag naming convention
         # last five digits are the same whereas in previous version
         # there was a prefix and first digits where the same
@@ -192,21 +434,23 @@ class EcoHabDataBase(object):
                 return []
             cage = [cage]
 
-        self.visits.mask_data([t_start, t_end])
+        visits = self.visits.window(t_start, t_end)
+        cage_codes = visits.encode("Address", cage)
         out = []
         for mouse in mice:
-            addresses = self.get_visit_addresses(mouse)
-            start_times = self.get_starttimes(mouse)
-            end_times = self.get_endtimes(mouse)
-            durations = self.get_visit_durations(mouse)
-            for i, a in enumerate(addresses):
-                if a in cage:
-                    visit = ufl.NamedDict("Visit_%s_%d" % (mouse, i),
-                                          mouse=mouse, address=a,
-                                          t_start=start_times[i],
-                                          t_end=end_times[i],
-                                          duration=durations[i])
-                    out.append(visit)
+            addresses = visits.get_visit_addresses(mouse)
+            in_cage = np.isin(visits.get_visit_address_codes(mouse),
+                              cage_codes)
+            start_times = visits.get_starttimes(mouse)
+            end_times = visits.get_endtimes(mouse)
+            durations = visits.get_durations(mouse)
+            for i in np.where(in_cage)[0].tolist():
+                visit = ufl.NamedDict("Visit_%s_%d" % (mouse, i),
+                                      mouse=mouse, address=addresses[i],
+                                      t_start=start_times[i],
+                                      t_end=end_times[i],
+                                      duration=durations[i])
+                out.append(visit)
         return sorted(out, key=lambda o: o["t_start"])
 
     def get_registration_stats(self, mouse, t_start,
@@ -233,23 +477,61 @@ class EcoHabDataBase(object):
               durations (ms) of tag registrations by the antenna in consecutive
               bins
         """
-        count_in_bins = []
-        durations_in_bins = []
-        t_s = t_start
-        while t_s < t_end:
-            t_e = t_s + binsize
-            self.mask_data(t_s, t_e)
-            antennas = self.get_antennas(mouse)
-            indices = np.where(np.array(antennas) == antenna)[0]
-            count_in_bins.append(len(indices))
-            durations = self.get_durations(mouse)
-            sum_time = 0
-            for ind in indices:
-                sum_time += durations[ind]
-            durations_in_bins.append(sum_time/1000)
-            self.unmask_data()
-            t_s = t_e
-        return count_in_bins, durations_in_bins
+        count, durations = self.get_registration_stats_array([mouse],
+                                                             t_start, t_end,
+                                                             [antenna],
+                                                             binsize)
+        return count[0, 0].tolist(), durations[0, 0].tolist()
+
+    def get_registration_stats_array(self, mice, t_start, t_end, antennas,
+                                     binsize):
+        """Count number and combined durations of registrations of mouse tags
+        by antennas in bins of size binsize for tags registered in a time
+        interval (t_start, t_end). All registrations are assigned
+        to antennas, mice and bins at once.
+
+        Args:
+        mice: list of strings
+        t_start: float
+           begining of the time interval (calculated from epoch)
+        t_end: float
+           end of the time interval (calculated from epoch)
+        antennas: list
+           antena ids
+        binsize: float
+           bin length
+
+        Returns:
+           count: int array (antenna x mouse x bin)
+              count of tag registrations by antennas in consecutive bins
+           durations: float array (antenna x mouse x bin)
+              durations (s) of tag registrations by antennas in consecutive
+              bins
+        """
+        edges = [t_start]
+        while edges[-1] < t_end:
+            edges.append(edges[-1] + binsize)
+        n_bins = len(edges) - 1
+        registrations = self.registrations.window(t_start, edges[-1])
+        times = registrations.getproperty_codes(mice, "Time")
+        bins = np.searchsorted(edges, times, side="right") - 1
+        n_tags = len(registrations.categories("Tag"))
+        mouse_idx = np.full(n_tags + 1, len(mice), dtype=int)
+        mouse_idx[registrations.encode("Tag", mice)] = np.arange(len(mice))
+        tags = registrations.getproperty_codes(mice, "Tag")
+        antenna_codes = registrations.get_antenna_codes(mice)
+        n_antennas = len(registrations.categories("Antenna"))
+        shape = (n_antennas + 1, len(mice) + 1, max(n_bins, 1))
+        idx = np.ravel_multi_index((antenna_codes, mouse_idx[tags],
+                                    np.clip(bins, 0, shape[2] - 1)), shape)
+        count = np.bincount(idx, minlength=np.prod(shape)).reshape(shape)
+        durations = np.bincount(idx, weights=registrations.getproperty_codes(
+            mice, "Duration"), minlength=np.prod(shape)).reshape(shape)
+        # unknown antennas (code -1) point to the last row with zeros
+        codes = registrations.encode("Antenna", antennas)
+        count = count[codes, :len(mice), :n_bins]
+        durations = durations[codes, :len(mice), :n_bins]/1000
+        return count, durations
 
 
 class Loader(EcoHabDataBase):
@@ -312,6 +594,25 @@ class Loader(EcoHabDataBase):
         add_date: True or False
            Add analysis date to results directory filename.
            As a default current date will be added.
+        n_jobs: int
+           number of worker processes used for parsing data files and
+           calculating visits of different animals. -1 uses all available
+           CPUs. By default files are read and visits calculated serially.
+        cache: True or False
+           Save parsed registrations, visits and diagnostics in a cache
+           file and read them in from the cache, if data files, the setup
+           config and Loader parameters have not changed since.
+           By default no cache is used.
+        cache_dir: string
+           directory for the cache file. By default the cache file is
+           saved in path.
+        diagnostics: "now", "background" or "lazy"
+           Diagnostics of antenna registrations are calculated (and saved
+           in the results directory) while loading the data ("now"),
+           in a background thread ("background"), or on the first access
+           of Loader.diagnostics ("lazy"). diagnostics_future gives access
+           to background diagnostics. By default diagnostics are
+           calculated while loading the data.
     """
     MAX_BREAK = 3*3600
     internal_antennas = []
@@ -336,19 +637,67 @@ class Loader(EcoHabDataBase):
 
         remove_antennas = kwargs.pop('remove_antennas', [])
         tags = kwargs.pop('legal_tags', "ALL")
+        self.n_jobs = kwargs.pop('n_jobs', 1)
+        use_cache = kwargs.pop('cache', False)
+        cache_dir = kwargs.pop('cache_dir', None)
+        self._diagnostics_mode = kwargs.pop('diagnostics', "now")
+        self._legal_tags = tags
+        self._remove_antennas = remove_antennas
         if add_date:
             today = date.today().strftime("%d.%m.%y")
             res_dir = "%s_%s" % (res_dir, today)
         self.res_dir = ufl.results_path(self.path, res_dir)
-        # Read in data
-        rawdata = self._read_in_raw_data(tags)
-        data = ufl.from_raw_data(rawdata)
-        data = ufl.remove_antennas(data, remove_antennas)
-        # As in antenna registrations
-        ufl.run_diagnostics(data, self.max_break, self.res_dir,
-                            antennas)
+        self._fnames = ufl.get_filenames(self.path)
+        if not len(self._fnames):
+            raise Exception("empty directory %s" % self.path)
+        self._cache_fname = None
+        # the key is calculated before data files are read in, so that
+        # a file modified while reading invalidates the cache
+        self._cache_key_value = None
+        # fname -> (size, modification time, number of rows read in)
+        self._files = {}
+        cached = None
+        if use_cache:
+            if cache_dir is None:
+                cache_dir = self.path
+            self._cache_fname = ufl.cache_fname(cache_dir, self.path)
+            self._cache_key_value = self._cache_key(antennas, self._fnames)
+            cached = ufl.load_cache(self._cache_fname,
+                                    self._cache_key_value)
+        if cached is None:
+            # Read in data
+            registrations = BaseFunctions.Data(self._read_in_raw_data(tags),
+                                               None)
+            visits = None
+        else:
+            registrations = BaseFunctions.Data(cached[0][0], None,
+                                               cached[0][1])
+            visits = BaseFunctions.Visits(cached[1][0], None, cached[1][1])
+            self._files = cached[2]
+        if self.mask:
+            # diagnostics are calculated for all the registrations read in
+            data, categories = registrations.encoded()
+            data = BaseFunctions.Data(data, self.mask, categories)
+        else:
+            data = registrations
         super(Loader, self).__init__(data, self.mask,
-                                     self.visit_threshold, antennas)
+                                     self.visit_threshold, antennas,
+                                     visits=visits, n_jobs=self.n_jobs)
+        diagnostics = None
+        if use_cache and cached is None:
+            ufl.save_cache(self._cache_fname, self._cache_key_value,
+                           registrations, self.visits, self._files)
+        elif cached is not None:
+            diagnostics = ufl.load_diagnostics_cache(self._cache_fname,
+                                                     self._cache_key_value)
+        if diagnostics is None:
+            # As in antenna registrations
+            self._start_diagnostics(self._diagnostics_mode,
+                                    self._run_diagnostics, registrations,
+                                    antennas, self._cache_key_value)
+        else:
+            ufl.save_diagnostics(diagnostics, self.res_dir)
+            self._diagnostics = diagnostics
         self.cages = antennas.cages
         self.directions = antennas.directions
         self.setup_config = antennas
@@ -359,21 +708,96 @@ class Loader(EcoHabDataBase):
         self.home_internal_antennas = antennas.homecage_internal_antennas
         self.stimulus_internal_antennas = antennas.stimCage_internal_antennas
 
-    def _read_in_raw_data(self, tags):
-        """Reads in data from files in self.path.
-        Removes ghost tags from data"""
-        raw_data = []
-        days = set()
-        self._fnames = ufl.get_filenames(self.path)
-        if not len(self._fnames):
-            raise Exception("empty directory %s" % self.path)
-        for f_name in self._fnames:
-            raw_data += ufl.read_single_file(self.path, f_name)
-            days.add(f_name.split('_')[0])
-        data = ufl.remove_ghost_tags(raw_data,
-                                     legal_tags=tags)
-        data.sort(key=lambda x: ufl.time_to_sec(x[1]))
-        return data
+    def _cache_key(self, setup_config, fnames):
+        return ufl.cache_key(self.path, fnames, setup_config,
+                             mask=self.mask,
+                             visit_threshold=self.visit_threshold,
+                             legal_tags=self._legal_tags,
+                             remove_antennas=self._remove_antennas,
+                             max_break=self.max_break)
+
+    def _run_diagnostics(self, registrations, setup_config, cache_key):
+        """Run diagnostics of registrations (Data) and save them
+        in the cache under cache_key (the key of registrations
+        calculated before they were read in), if cache_key is not None.
+        Registrations and visits are cached right after they are read in.
+        """
+        diagnostics = ufl.run_diagnostics(registrations, self.max_break,
+                                          self.res_dir, setup_config)
+        if cache_key is not None:
+            ufl.save_diagnostics_cache(self._cache_fname, cache_key,
+                                       diagnostics)
+        return diagnostics
+
+    def refresh(self):
+        """Read in data files that have been added to self.path since
+        the data was loaded and registrations appended to data files
+        read in before (e.g. during an ongoing experiment).
+
+        Only the new files and the files that have changed (size or
+        modification time) are parsed. Data files are assumed to be
+        only appended to, so rows of changed files that have already
+        been read in are skipped. New registrations are appended
+        to the registrations and visits are extended by rerunning the
+        position algorithm from the last registration of every animal
+        that can be influenced by the new registrations. Diagnostics are
+        recalculated for the whole dataset.
+
+        Returns:
+           list of names of new and changed data files
+        """
+        fnames = ufl.get_filenames(self.path)
+        old_fnames = set(self._fnames)
+        new_fnames = sorted([f for f in fnames if f not in old_fnames])
+        stats = ufl.file_stats(self.path, [f for f in self._files
+                                           if f in fnames])
+        changed = sorted([f for f, stat in stats.items()
+                          if stat != self._files[f][:2]])
+        if not new_fnames and not changed:
+            return []
+        fnames = self._fnames + new_fnames
+        if self._cache_fname is not None:
+            cache_key = self._cache_key(self.setup_config, fnames)
+        else:
+            cache_key = None
+        data = BaseFunctions.Data(self._read_in_raw_data(self._legal_tags,
+                                                         changed +
+                                                         new_fnames),
+                                  self.mask)
+        self._fnames = fnames
+        self._cache_key_value = cache_key
+        if len(data):
+            self._append_registrations(data, self.setup_config)
+        if cache_key is not None:
+            ufl.save_cache(self._cache_fname, cache_key,
+                           self.registrations, self.visits, self._files)
+        self._start_diagnostics(self._diagnostics_mode,
+                                self._run_diagnostics, self.registrations,
+                                self.setup_config, cache_key)
+        return sorted(changed + new_fnames)
+
+    def _read_in_raw_data(self, tags, fnames=None):
+        """Reads in data from files in self.path (or data files fnames).
+        Files recorded outside of self.mask are skipped. Registrations
+        of ghost tags and by removed antennas are dropped while parsing.
+        Rows of files, which have already been read in, are skipped
+        (see refresh). Registrations from all the files are merged by time"""
+        if fnames is None:
+            fnames = self._fnames
+        fnames = ufl.select_fnames(fnames, self.mask)
+        # files are checked before reading, so that rows appended
+        # while reading are read in by the next refresh
+        stats = ufl.file_stats(self.path, fnames)
+        raw_data = ufl.read_files(self.path, fnames, self.n_jobs,
+                                  legal_tags=tags,
+                                  remove_antennas=self._remove_antennas)
+        files = dict(self._files)
+        for i, fname in enumerate(fnames):
+            n_read = files.get(fname, (0, 0, 0))[2]
+            files[fname] = stats[fname] + (len(raw_data[i]),)
+            raw_data[i] = raw_data[i][n_read:]
+        self._files = files
+        return ufl.merge_sorted(raw_data, "Time")
 
     def __repr__(self):
         """Nice string representation for printing this class."""
@@ -427,19 +851,38 @@ class Merger(EcoHabDataBase):
 
     loaders:
         Eco-HAB datasets
+
+    Keyword Args:
+    prefix: str
+        a prefix added to all generated result files.
+    n_jobs: int
+        number of worker processes calculating visits of different animals.
+        -1 uses all available CPUs. By default visits are calculated
+        serially.
+    diagnostics: "now", "background" or "lazy"
+        calculate diagnostics of merged registrations while merging
+        the data ("now", default), in a background thread ("background")
+        or on the first access of Merger.diagnostics ("lazy").
     """
-    def __init__(self, experiment_config, res_dir, *loaders, prefix=None):
-        datasets = []
+    def __init__(self, experiment_config, res_dir, *loaders, prefix=None,
+                 n_jobs=1, diagnostics="now"):
+        encoded = []
         configs = {}
         max_breaks = []
         for loader in loaders:
             setup_name = loader.setup_name
             configs[setup_name] = loader.setup_config
-            datasets.append(ufl.rename_antennas(setup_name,
-                                                loader.registrations.data))
+            data, categories = loader.registrations.encoded()
+            labels = categories["Antenna"]
+            categories["Antenna"] = np.array(["%s_%s" % (antenna, setup_name)
+                                              for antenna in labels.tolist()],
+                                             dtype=labels.dtype)
+            encoded.append((data, categories))
             max_breaks.append(loader.max_break)
 
-        data = ufl.append_data_sources(datasets)
+        datasets, categories = BaseFunctions.recode(encoded)
+        data = BaseFunctions.Data(ufl.append_data_sources(datasets), None,
+                                  categories)
         mask = None
         self.visit_threshold = max([d.visit_threshold for d in loaders])
         if isinstance(prefix, str):
@@ -450,12 +893,14 @@ class Merger(EcoHabDataBase):
         self.res_dir = "%s_%s" % (res_dir, today)
         antennas = ExperimentSetupConfig(experiment_config, **configs)
         super(Merger, self).__init__(data, mask,
-                                     self.visit_threshold, antennas)
+                                     self.visit_threshold, antennas,
+                                     n_jobs=n_jobs)
         self.cages = antennas.cages
         self.directions = antennas.directions
         self.setup_config = antennas
         self.all_antennas = antennas.all_antennas
         self.internal_antennas = antennas.internal_antennas
         self.max_break = max(max_breaks)
-        ufl.run_diagnostics(data, self.max_break, self.res_dir,
-                            antennas)
+        self._start_diagnostics(diagnostics, ufl.run_diagnostics,
+                                self.registrations, self.max_break,
+                                self.res_dir, antennas)
@@ -6,6 +6,7 @@ from __future__ import division, absolute_import, print_function
 import os
 import glob
 import sys
+import numpy as np
 
 from pyEcoHAB import data_path
 
@@ -15,6 +16,167 @@ else:
     from configparser import RawConfigParser, DuplicateSectionError
 
 
+# categories of transitions between registrations by two antennas
+# (in the order used by get_animal_position)
+TRANSITION_UNDEFINED = -1
+SAME_ANTENNA = 0
+SAME_TUNNEL = 1
+SAME_ADDRESS = 2
+SURROUNDING = 3
+OPPOSITE_TUNNEL = 4
+NON_ADJACENT = 5
+INTERNAL = 6
+
+
+class SetupTopology(object):
+    """
+    Frozen description of the experimental setup compiled from
+    a SetupConfig or an ExperimentSetupConfig.
+
+    Antennas are given integer codes (positions in the alphabetically
+    sorted list of all antennas), and cages, tunnels and transitions
+    between antennas are stored in arrays indexed by these codes, so they
+    can be looked up in O(1) time. All antennas that are not part of
+    the setup share the last code (len(antennas)). Do not create
+    SetupTopology directly, use the topology property of a setup config.
+
+    Attributes:
+       antennas: tuple of antennas (antenna with code i is antennas[i])
+       codes: dictionary antenna -> code
+       internal: bool array, True for internal antennas
+       internal_antennas: frozenset of internal antennas
+       cages, tunnels: tuples of cage and tunnel names
+       cage: int array, cage (position in cages) of each antenna or -1
+       tunnel: int array, tunnel of each entrance antenna or -1. Antennas
+         with the same entrance antennas to their tunnel share the tunnel.
+       antenna_tunnel: dictionary entrance antenna -> tunnel
+       other_tunnel_antennas: dictionary entrance antenna -> tuple of other
+         entrance antennas to the same tunnel
+       addresses: tuple of all possible animal locations
+       transitions: int matrix of transition categories between every pair
+         of antennas (SAME_ANTENNA, SAME_TUNNEL, SAME_ADDRESS, SURROUNDING,
+         OPPOSITE_TUNNEL, NON_ADJACENT, INTERNAL or TRANSITION_UNDEFINED)
+       transition_address: int matrix, position in addresses of the
+         location of an animal after a transition or -1 (no location)
+       transition_valid: bool matrix, True if the location after the
+         transition is certain
+       internal_address: int array, position in addresses of the cage of
+         each internal antenna or -1
+    """
+    def __init__(self, config):
+        antennas = sorted(set(config.all_antennas) | set(config.address))
+        internal_antennas = frozenset(config.internal_antennas)
+        cages = tuple(config.cages)
+        tunnels = tuple(sorted(set(tuple(value) for value
+                                   in config.same_tunnel.values())))
+        addresses = list(cages)
+        codes = {antenna: i for i, antenna in enumerate(antennas)}
+        n = len(antennas) + 1
+        # an antenna name that is not used in any setup
+        unknown = "unknown antenna %s" % "".join(antennas)
+
+        def address_idx(address):
+            if address not in addresses:
+                addresses.append(address)
+            return addresses.index(address)
+
+        internal = np.array([a in internal_antennas for a in antennas] +
+                            [False], dtype=bool)
+        cage = np.array([cages.index(config.address[a])
+                         if a in config.address else -1
+                         for a in antennas] + [-1], dtype=int)
+        antenna_tunnel = {a: tunnels.index(tuple(value))
+                          for a, value in config.same_tunnel.items()}
+        tunnel = np.array([antenna_tunnel.get(a, -1) for a in antennas] +
+                          [-1], dtype=int)
+        other_tunnel_antennas = {a: tuple(config.other_tunnel_antenna(a))
+                                 for a in config.same_tunnel}
+        internal_address = np.array([address_idx(config.address[a])
+                                     if a in config.address and
+                                     a in internal_antennas else -1
+                                     for a in antennas] + [-1], dtype=int)
+        transitions = np.full((n, n), TRANSITION_UNDEFINED, dtype=int)
+        transition_address = np.full((n, n), -1, dtype=int)
+        transition_valid = np.zeros((n, n), dtype=bool)
+        for i, a1 in enumerate(antennas + [unknown]):
+            for j, a2 in enumerate(antennas + [unknown]):
+                category, address, valid = self._classify(config, a1, a2,
+                                                          internal_antennas)
+                transitions[i, j] = category
+                if address is not None:
+                    transition_address[i, j] = address_idx(address)
+                    transition_valid[i, j] = valid
+        for arr in [internal, cage, tunnel, internal_address, transitions,
+                    transition_address, transition_valid]:
+            arr.flags.writeable = False
+
+        self.__dict__.update(antennas=tuple(antennas), codes=codes,
+                             internal=internal,
+                             internal_antennas=internal_antennas,
+                             cages=cages, tunnels=tunnels, cage=cage,
+                             tunnel=tunnel, antenna_tunnel=antenna_tunnel,
+                             other_tunnel_antennas=other_tunnel_antennas,
+                             addresses=tuple(addresses),
+                             internal_address=internal_address,
+                             transitions=transitions,
+                             transition_address=transition_address,
+                             transition_valid=transition_valid)
+
+    @staticmethod
+    def _classify(config, a1, a2, internal_antennas):
+        """
+        Classify transition between antennas a1 and a2 in the same way
+        as get_animal_position. Returns category, address (or None)
+        and validity of the location.
+        """
+        if a1 in internal_antennas or a2 in internal_antennas:
+            return INTERNAL, None, False
+        try:
+            if a1 == a2:
+                return SAME_ANTENNA, config.address[a1], True
+            if a1 in config.same_tunnel and a2 in config.same_tunnel[a1]:
+                return SAME_TUNNEL, None, False
+            if a2 in config.same_address[a1]:
+                return SAME_ADDRESS, config.address[a1], True
+            key = (min(a1, a2), max(a1, a2))
+            if key in config.address_surrounding:
+                return SURROUNDING, config.address_surrounding[key], False
+            if (a1 in config.opposite_tunnel and
+                    a2 in config.opposite_tunnel[a1]):
+                return OPPOSITE_TUNNEL, None, False
+            return NON_ADJACENT, config.address_non_adjacent[a1], False
+        except KeyError:
+            return TRANSITION_UNDEFINED, None, False
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SetupTopology is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("SetupTopology is read-only")
+
+    def encode(self, antennas):
+        """
+        Return codes of antennas (an int array). Antennas, which are
+        not part of the setup, get code len(self.antennas).
+        """
+        antennas = np.asarray(antennas)
+        if not len(antennas):
+            return np.array([], dtype=int)
+        labels, inverse = np.unique(antennas, return_inverse=True)
+        codes = np.array([self.codes.get(a, len(self.antennas))
+                          for a in labels.tolist()], dtype=int)
+        return codes[inverse.ravel()]
+
+    def decode(self, code):
+        """
+        Return the antenna with code (None for antennas, which are not
+        part of the setup).
+        """
+        if code < len(self.antennas):
+            return self.antennas[code]
+        return None
+
+
 class SetupConfigMethods(RawConfigParser):
     """
     Methods for finding parameters describing compartments
@@ -30,6 +192,7 @@ class SetupConfigMethods(RawConfigParser):
         """
         Find all necessary parameters.
         """
+        self._topology = None
         self.all_antennas = self.get_all_antennas()
         self.cages_dict = self.get_cages_dict()
         self.tunnels_dict = self.get_tunnels_dict()
@@ -41,6 +204,15 @@ class SetupConfigMethods(RawConfigParser):
         self.address_surrounding = self.get_surrounding_dict()
         self.directions = self.get_directions_dict()
 
+    @property
+    def topology(self):
+        """
+        Return the setup compiled into a SetupTopology (calculated once).
+        """
+        if getattr(self, "_topology", None) is None:
+            self._topology = SetupTopology(self)
+        return self._topology
+
     def get_all_antennas(self):
         """
         Return a list of all antennas provided by experimental setup files.
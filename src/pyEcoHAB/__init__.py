@@ -6,6 +6,7 @@ sample_data = os.path.join(data_path, "BALB_VPA_data_cohort_1")
 
 from .Loader import Loader, Merger
 from .Timeline import Timeline
+from .utils.for_loading import iter_registrations
 from .SetupConfig import SetupConfig, ExperimentSetupConfig, IdentityConfig
 from .incohort_sociability import get_incohort_sociability
 from .incohort_sociability import get_solitude
@@ -9,7 +9,7 @@ from .plotting_functions import make_visit_duration_histogram
 
 
 def get_visits(intervals, t_start, t_stop):
-    interval_array = np.array(intervals)
+    interval_array = np.asarray(intervals)
     visit_list = []
     added_interval = False
 
@@ -44,6 +44,7 @@ def get_visits(intervals, t_start, t_stop):
 def get_visits_in_bins(intervals, time_start,
                        time_stop, binsize):
     length = utils.get_length(time_start, time_stop, binsize)
+    intervals = np.array(intervals)
     visits = []
     added_visit = []
     for i in range(length):
@@ -89,22 +89,145 @@ def gen_directions_dict(directions_dict, duration, keys):
     return new_dict
 
 
+def generate_intervals_batch(t_starts, t_stops, duration, N, random_state):
+    """
+    Generate N sets of intervals of the same durations as intervals
+    (t_starts, t_stops) placed randomly in (0, duration) without overlaps.
+
+    Every set is a random order of the intervals separated by random gaps,
+    which partition the time not covered by the intervals, so every
+    set is generated at once without rejecting overlapping placements.
+
+    Args:
+       t_starts: list of interval starts
+       t_stops: list of interval ends
+       duration: float
+       N: int
+         number of sets
+       random_state: numpy.random.RandomState
+    Returns:
+       starts, ends: N x len(t_starts) arrays of interval starts and ends
+       (sorted by starts in every row)
+    """
+    intervals = np.abs(np.asarray(t_stops, dtype=float)
+                       - np.asarray(t_starts, dtype=float))
+    free_time = duration - intervals.sum()
+    if free_time < 0:
+        raise Exception("Intervals are longer than %f s" % duration)
+    order = random_state.rand(N, len(intervals)).argsort(axis=1)
+    shuffled = intervals[order]
+    gaps = np.sort(random_state.uniform(0, free_time,
+                                        (N, len(intervals))), axis=1)
+    starts = gaps + np.cumsum(shuffled, axis=1) - shuffled
+    return starts, starts + shuffled
+
+
+def searchsorted_rows(rows, values, new_rows, new_values):
+    """
+    Return indices into values (sorted by rows and then values), where
+    new_values would be inserted (as np.searchsorted(side="left")) into
+    values from the same rows.
+    """
+    kind = np.concatenate((np.ones(len(values), dtype=int),
+                           np.zeros(len(new_values), dtype=int)))
+    order = np.lexsort((kind,
+                        np.concatenate((values, new_values)),
+                        np.concatenate((rows, new_rows))))
+    is_new = order >= len(values)
+    idxs = np.empty(len(new_values), dtype=int)
+    idxs[order[is_new] - len(values)] = np.cumsum(~is_new)[is_new]
+    return idxs
+
+
+def following_single_direction_batch(intervals_m1, intervals_m2):
+    """
+    Count followings (as following_single_direction) in every row
+    of N x n arrays of passage starts and ends (sorted by starts in
+    every row), e.g. intervals generated by generate_intervals_batch.
+
+    Returns:
+       arrays (N) of numbers of followings and times spent in the tunnel
+       together
+    """
+    t_starts_m1, t_ends_m1 = intervals_m1
+    t_starts_m2, t_ends_m2 = intervals_m2
+    N = t_starts_m1.shape[0]
+    rows_m1 = np.repeat(np.arange(N), t_starts_m1.shape[1])
+    rows_m2 = np.repeat(np.arange(N), t_starts_m2.shape[1])
+    t_starts_m1, t_ends_m1 = t_starts_m1.ravel(), t_ends_m1.ravel()
+    t_starts_m2, t_ends_m2 = t_starts_m2.ravel(), t_ends_m2.ravel()
+    firsts = searchsorted_rows(rows_m2, t_starts_m2, rows_m1, t_starts_m1)
+    lasts = searchsorted_rows(rows_m2, t_starts_m2, rows_m1, t_ends_m1)
+    counts = np.maximum(lasts - firsts, 0)
+    idx_m1 = np.repeat(np.arange(len(t_starts_m1)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    idx_m2 = np.repeat(firsts, counts) + offsets
+    follows = t_ends_m2[idx_m2] > t_ends_m1[idx_m1]
+    idx_m1, first = np.unique(idx_m1[follows], return_index=True)
+    idx_m2 = idx_m2[follows][first]
+    followings = np.bincount(rows_m1[idx_m1], minlength=N)
+    time_together = np.bincount(rows_m1[idx_m1],
+                                weights=t_ends_m1[idx_m1]
+                                - t_starts_m2[idx_m2],
+                                minlength=N)
+    return followings, time_together
+
+
+def following_matrices_batch(directions_batch, mice, t_start, t_stop, keys):
+    """
+    Calculate followings and fractions of time spent together
+    (as following_matrices) for N sets of passages of every mouse
+    (directions_batch[mouse][key] is a pair of N x n arrays).
+
+    Returns:
+       dictionaries (mouse1 -> mouse2 -> array (N)) of followings and
+       times together
+    """
+    assert t_stop - t_start > 0
+    durations = t_stop - t_start
+    followings = utils.make_results_dict(mice)
+    time_together = utils.make_results_dict(mice)
+    for mouse1 in mice:
+        for mouse2 in mice:
+            if mouse1 == mouse2:
+                continue
+            for key in keys:
+                out = following_single_direction_batch(
+                    directions_batch[mouse1][key],
+                    directions_batch[mouse2][key])
+                followings[mouse1][mouse2] = followings[mouse1][mouse2]\
+                    + out[0]
+                time_together[mouse1][mouse2] = time_together[mouse1][mouse2]\
+                    + out[1]
+            time_together[mouse1][mouse2] = time_together[mouse1][mouse2]\
+                / durations
+    return followings, time_together
+
+
 def bootstrap_single_phase(directions_dict, mice_list,
                            t_start, t_stop, keys, N=1000):
     followings = utils.make_results_dict(mice_list, tolist=True)
     times_together = utils.make_results_dict(mice_list, tolist=True)
+    # seeded from random, so that random.seed makes results reproducible
+    random_state = np.random.RandomState(random.randrange(2**32))
     new_directions = {}
-    for i in range(N):
-        for mouse in mice_list:
-            new_directions[mouse] = gen_directions_dict(directions_dict[mouse],
-                                                        t_stop - t_start, keys)
-        out = following_matrices(new_directions, mice_list,
-                                 t_start, t_stop, keys)
-        for m1 in mice_list:
-            for m2 in mice_list:
-                if m1 != m2:
-                    followings[m1][m2].append(out[0][m1][m2])
-                    times_together[m1][m2].append(out[1][m1][m2])
+    for mouse in mice_list:
+        new_directions[mouse] = {}
+        for key in keys:
+            new_directions[mouse][key] = generate_intervals_batch(
+                directions_dict[mouse][key][0],
+                directions_dict[mouse][key][1],
+                t_stop - t_start, N, random_state)
+    out = following_matrices_batch(new_directions, mice_list,
+                                   t_start, t_stop, keys)
+    for m1 in mice_list:
+        for m2 in mice_list:
+            if m1 != m2:
+                followings[m1][m2] = (np.zeros(N, dtype=int)
+                                      + out[0][m1][m2]).tolist()
+                times_together[m1][m2] = (np.zeros(N)
+                                          + out[1][m1][m2]).tolist()
     return followings, times_together
 
 
@@ -233,22 +356,51 @@ def following_matrices(directions_dict, mice, t_start, t_stop, keys):
 
 
 def following_single_direction(intervals_m1, intervals_m2):
-    t_starts_m1, t_ends_m1 = intervals_m1
-    t_starts_m2, t_ends_m2 = intervals_m2
-    counter = 0
-    time_together = 0
-    intervals = []
-    for i in range(len(t_starts_m1)):
-        indxs = utils.get_idx_between(t_starts_m1[i],
-                                      t_ends_m1[i],
-                                      t_starts_m2)
-        for idx in indxs:
-            if t_ends_m2[idx] > t_ends_m1[i]:
-                counter += 1
-                time_together += t_ends_m1[i] - t_starts_m2[idx]
-                intervals.append(t_ends_m2[idx] - t_starts_m1[i])
-                break
-    return counter, time_together, intervals
+    """
+    Count passages of mouse 2 following mouse 1 through a tunnel in
+    the same direction.
+
+    A passage of mouse 1 is followed, if a passage of mouse 2 starts
+    during it and ends after it (the first such passage of mouse 2 is
+    taken into account). Candidate passages of mouse 2 for all passages
+    of mouse 1 are found with one searchsorted call.
+
+    Args:
+       intervals_m1: starts and ends of passages of mouse 1
+       intervals_m2: starts and ends of passages of mouse 2
+    Returns:
+       number of followings, time spent in the tunnel together and
+       intervals between start of mouse 1 passage and end of mouse 2
+       passage for every following
+    """
+    t_starts_m1, t_ends_m1 = [np.asarray(x) for x in intervals_m1]
+    t_starts_m2, t_ends_m2 = [np.asarray(x) for x in intervals_m2]
+    if not len(t_starts_m1) or not len(t_starts_m2):
+        return 0, 0, []
+    order = np.argsort(t_starts_m2, kind="stable")
+    sorted_starts = t_starts_m2[order]
+    firsts = np.searchsorted(sorted_starts, t_starts_m1, side="left")
+    lasts = np.searchsorted(sorted_starts, t_ends_m1, side="left")
+    counts = np.maximum(lasts - firsts, 0)
+    # all pairs (passage of mouse 1, passage of mouse 2 starting during it)
+    idx_m1 = np.repeat(np.arange(len(t_starts_m1)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    idx_m2 = order[np.repeat(firsts, counts) + offsets]
+    follows = t_ends_m2[idx_m2] > t_ends_m1[idx_m1]
+    idx_m1, idx_m2 = idx_m1[follows], idx_m2[follows]
+    # the first passage of mouse 2 (in the order of intervals_m2)
+    # for every passage of mouse 1
+    pairs = np.lexsort((idx_m2, idx_m1))
+    idx_m1, idx_m2 = idx_m1[pairs], idx_m2[pairs]
+    idx_m1, first = np.unique(idx_m1, return_index=True)
+    idx_m2 = idx_m2[first]
+    if not len(idx_m1):
+        return 0, 0, []
+    # cumsum adds consecutive values in order, as a loop would
+    time_together = np.cumsum(t_ends_m1[idx_m1] - t_starts_m2[idx_m2])
+    intervals = t_ends_m2[idx_m2] - t_starts_m1[idx_m1]
+    return len(idx_m1), time_together[-1].item(), intervals.tolist()
 
 
 def add_intervals(all_intervals, phase_intervals):
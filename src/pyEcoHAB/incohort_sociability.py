@@ -74,21 +74,60 @@ def remove_overlapping_intervals(intervals_mouse1, intervals_mouse2):
             i = i + 1
 
 
+def get_occupancy(data_mice, mice, address):
+    """
+    Return the number of mice present in address as a step function.
+
+    Args:
+       data_mice: dict
+         mouse -> list of (address, start, end), e.g. output of
+         prepare_data
+       mice: list of animal tags
+       address: str
+    Returns:
+       times: array of consecutive starts and ends of visits
+       counts: array of numbers of mice present between times[i]
+         and times[i + 1]
+       owners: array of indices (in mice) of the animal present between
+         times[i] and times[i + 1], if it is the only animal present,
+         and -1 otherwise
+    """
+    starts, ends, owners, positions = get_cage_intervals(data_mice, mice,
+                                                         address)
+    times = np.unique(np.concatenate((starts, ends)))
+    counts = np.zeros(len(times), dtype=int)
+    ids = np.zeros(len(times), dtype=int)
+    idx_starts = np.searchsorted(times, starts)
+    idx_ends = np.searchsorted(times, ends)
+    np.add.at(counts, idx_starts, 1)
+    np.add.at(counts, idx_ends, -1)
+    # sum of (index + 1) of animals present is the index of the animal
+    # (+ 1), if only one is present
+    np.add.at(ids, idx_starts, owners + 1)
+    np.add.at(ids, idx_ends, -owners - 1)
+    counts = np.cumsum(counts)[:-1]
+    ids = np.cumsum(ids)[:-1]
+    return times, counts, np.where(counts == 1, ids - 1, -1)
+
+
 def mouse_alone(data_mice, address):
-    ints = prepare_mice_intervals(data_mice, address)
-    new_intervals = {}
+    """
+    Return the time each mouse spent alone in address.
+
+    The time is measured from the number of mice present in address
+    (get_occupancy), i.e. it is the total length of the periods
+    when the mouse was the only animal present.
+    """
+    mice = list(data_mice.keys())
+    times, counts, owners = get_occupancy(data_mice, mice, address)
+    alone = {mouse: [] for mouse in mice}
+    times = times.tolist()
+    for idx, owner in enumerate(owners.tolist()):
+        if owner >= 0:
+            alone[mice[owner]].append(abs(times[idx + 1] - times[idx]))
     result = {}
-    for mouse in ints.keys():
-        mouse_ints = []
-        mouse_ints.append(ints[mouse][0][:])
-        mouse_ints.append(ints[mouse][1][:])
-        for other_mouse in ints.keys():
-            if mouse != other_mouse:
-                remove_overlapping_intervals(mouse_ints, ints[other_mouse])
-        new_intervals[mouse] = mouse_ints
-    for mouse in new_intervals:
-        result[mouse] = utils.get_duration(new_intervals[mouse][0],
-                                           new_intervals[mouse][1])
+    for mouse in mice:
+        result[mouse] = sum(alone[mouse])
     return result
 
 
@@ -108,13 +147,12 @@ def get_solitude(ecohab_data, timeline, res_dir="", prefix="", delimiter=";"):
         res_dir = ecohab_data.res_dir
     phases = utils.filter_dark_light(timeline.sections())
     output = make_solitude_output(ecohab_data.cages, ecohab_data.mice)
-    for phase in phases:
-        times = timeline.get_time_from_epoch(phase)
-        data = utils.prepare_data(ecohab_data, ecohab_data.mice, times)
-        for address in ecohab_data.cages:
-            alone = mouse_alone(data, address)
-            for mouse in ecohab_data.mice:
-                output[address][mouse][phase] = alone[mouse]
+    times = [timeline.get_time_from_epoch(phase) for phase in phases]
+    alone = get_colocation(ecohab_data, ecohab_data.mice, times)[2].tolist()
+    for i, phase in enumerate(phases):
+        for j, address in enumerate(ecohab_data.cages):
+            for k, mouse in enumerate(ecohab_data.mice):
+                output[address][mouse][phase] = alone[i][j][k]
     write_csv_alone(output, phases, res_dir, prefix, delimiter=delimiter)
     return output
 
@@ -128,6 +166,79 @@ def mice_overlap(ints1, ints2):
     return total_overlap
 
 
+def get_cage_intervals(data_mice, mice, address):
+    """
+    Return starts, ends, animal indices and indices of visits within
+    the animal's visits to address for all animals, sorted by start.
+    """
+    starts, ends, owners, positions = [], [], [], []
+    for i, mouse in enumerate(mice):
+        ints = utils.get_intervals(data_mice[mouse], address)
+        starts.extend([st for st, en in ints])
+        ends.extend([en for st, en in ints])
+        owners.extend([i]*len(ints))
+        positions.extend(range(len(ints)))
+    order = np.argsort(starts, kind="stable")
+    return (np.array(starts, dtype=float)[order],
+            np.array(ends, dtype=float)[order],
+            np.array(owners, dtype=int)[order],
+            np.array(positions, dtype=int)[order])
+
+
+def mice_overlap_matrix(data_mice, mice, address):
+    """
+    Return times spent together in address by all pairs of mice.
+
+    Visits are swept in order of their starts. Every visit is paired only
+    with visits of other mice starting before it ends, which are found
+    with searchsorted, so the cost is O((n + k) log n) for n visits
+    and k overlapping visits. Overlaps of each pair of mice are summed in
+    the order used by mice_overlap.
+
+    Args:
+       data_mice: dict
+         mouse -> list of (address, start, end), e.g. output of
+         prepare_data
+       mice: list of animal tags
+       address: str
+    Returns:
+       symmetric len(mice) x len(mice) array of overlaps
+    """
+    result = np.zeros((len(mice), len(mice)))
+    starts, ends, owners, positions = get_cage_intervals(data_mice, mice,
+                                                         address)
+    if len(starts) < 2:
+        return result
+    lasts = np.searchsorted(starts, ends, side="left")
+    counts = np.maximum(lasts - np.arange(1, len(starts) + 1), 0)
+    first = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    second = first + 1 + offsets
+    keep = owners[first] != owners[second]
+    first, second = first[keep], second[keep]
+    if not len(first):
+        return result
+    overlaps = np.minimum(ends[first], ends[second]) - starts[second]
+    # order the overlaps as in mice_overlap(ints of m1, ints of m2),
+    # where m1 precedes m2 in mice
+    swap = owners[first] > owners[second]
+    m1 = np.where(swap, owners[second], owners[first])
+    m2 = np.where(swap, owners[first], owners[second])
+    i1 = np.where(swap, positions[second], positions[first])
+    i2 = np.where(swap, positions[first], positions[second])
+    order = np.lexsort((i2, i1, m2, m1))
+    totals = {}
+    for key_1, key_2, overlap in zip(m1[order].tolist(),
+                                     m2[order].tolist(),
+                                     overlaps[order].tolist()):
+        totals[key_1, key_2] = totals.get((key_1, key_2), 0) + overlap
+    for (key_1, key_2), overlap in totals.items():
+        result[key_1, key_2] = overlap
+        result[key_2, key_1] = overlap
+    return result
+
+
 def time_fraction_together_one_cage(ints1, ints2, total_time):
     assert total_time > 0
     return mice_overlap(ints1, ints2)/total_time
@@ -156,20 +267,90 @@ def mice_together(data_mice, m1, m2, addresses, tot_t):
     return time_together, exp_time_together
 
 
-def single_phase_results(data, mice, addresses, total_time):
+def colocation_results(overlaps, durations, mice, total_time):
+    """
+    Return measured and expected fractions of total_time spent together
+    by pairs of mice from times spent together (overlaps[cage][m1][m2])
+    and times spent (durations[cage][m1]) in each cage.
+    """
     res = utils.make_results_dict(mice)
     res_exp = utils.make_results_dict(mice)
+    if len(mice) < 2:
+        return res, res_exp
+    assert total_time > 0
     for ii, m1 in enumerate(mice):
         for jj in range(ii + 1, len(mice)):
             m2 = mice[jj]
-            res[m1][m2], res_exp[m1][m2] = mice_together(data,
-                                                         m1,
-                                                         m2,
-                                                         addresses,
-                                                         total_time)
+            time_together = 0
+            exp_time_together = 0
+            for k in range(len(overlaps)):
+                time_together += overlaps[k][ii][jj]/total_time
+                exp_time_together += durations[k][ii]/total_time\
+                    * durations[k][jj]/total_time
+            res[m1][m2], res_exp[m1][m2] = time_together, exp_time_together
     return res, res_exp
 
 
+def single_phase_results(data, mice, addresses, total_time):
+    overlaps = [mice_overlap_matrix(data, mice, address).tolist()
+                for address in addresses]
+    durations = [[utils.calculate_total_duration(
+        utils.get_intervals(data[mouse], address)) for mouse in mice]
+                 for address in addresses]
+    return colocation_results(overlaps, durations, mice, total_time)
+
+
+def get_colocation(ecohab_data, mice, intervals):
+    """
+    Return times spent together by all pairs of mice, times spent and
+    times spent alone by every mouse in every cage in time intervals.
+
+    Results for each interval are calculated once and cached in
+    ecohab_data, so analyses using the same time bins (e.g. in-cohort
+    sociability and solitude) share them.
+
+    Args:
+       ecohab_data: Loader or Merger
+       mice: list of animal tags
+       intervals: list of (t_start, t_end) pairs
+    Returns:
+       overlaps: array (intervals x cages x mice x mice)
+         times spent together in cages of ecohab_data.cages
+       durations: array (intervals x cages x mice)
+         times spent in cages
+       alone: array (intervals x cages x mice)
+         times spent alone in cages
+    """
+    cages = ecohab_data.cages
+    cache = getattr(ecohab_data, "_colocation_cache", {})
+    keys = [(tuple(mice), float(t_start), float(t_end))
+            for t_start, t_end in intervals]
+    missing = sorted(set(key for key in keys if key not in cache),
+                     key=keys.index)
+    data = utils.prepare_data_bins(ecohab_data, mice,
+                                   [key[1:] for key in missing])
+    for key, data_mice in zip(missing, data):
+        alone = [mouse_alone(data_mice, address) for address in cages]
+        cache[key] = (
+            np.array([mice_overlap_matrix(data_mice, mice, address)
+                      for address in cages]).reshape(len(cages),
+                                                     len(mice),
+                                                     len(mice)),
+            np.array([[utils.calculate_total_duration(
+                utils.get_intervals(data_mice[mouse], address))
+                       for mouse in mice] for address in cages],
+                     dtype=float).reshape(len(cages), len(mice)),
+            np.array([[alone_in_cage[mouse] for mouse in mice]
+                      for alone_in_cage in alone],
+                     dtype=float).reshape(len(cages), len(mice)))
+    overlaps = np.zeros((len(keys), len(cages), len(mice), len(mice)))
+    durations = np.zeros((len(keys), len(cages), len(mice)))
+    alone = np.zeros((len(keys), len(cages), len(mice)))
+    for i, key in enumerate(keys):
+        overlaps[i], durations[i], alone[i] = cache[key]
+    return overlaps, durations, alone
+
+
 def get_incohort_sociability(ecohab_data, timeline, binsize, res_dir="",
                              prefix="", remove_mouse="", delimiter=";"):
 
@@ -230,9 +411,16 @@ def get_incohort_sociability(ecohab_data, timeline, binsize, res_dir="",
                                                                add_info_mice)
     excess_prefix = "incohort_sociability_excess_time_%s_%s" % (prefix,
                                                                 add_info_mice)
-    phases, time, data, keys = utils.prepare_binned_data(ecohab_data,
-                                                         timeline, binsize,
-                                                         mice)
+    if isinstance(binsize, int) or isinstance(binsize, float):
+        shortest_phase = utils.get_shortest_phase_duration(timeline)
+        phases, all_phases, bin_labels, intervals = utils.get_bins(
+            timeline, binsize, shortest_phase, utils.get_times(binsize))
+        keys = [all_phases, bin_labels]
+    else:
+        phases, time, data, keys = utils.prepare_binned_data(ecohab_data,
+                                                             timeline,
+                                                             binsize,
+                                                             mice)
 
     if isinstance(binsize, int) or isinstance(binsize, float):
         binsize_name = "%3.2f_h" % (binsize/3600)
@@ -243,8 +431,8 @@ def get_incohort_sociability(ecohab_data, timeline, binsize, res_dir="",
                                                  len(mice)))
     else:
         binsize_name = binsize
-    if time == 0:
-        return
+        if time == 0:
+            return
     full_results = utils.make_all_results_dict(*keys)
     full_results_exp = utils.make_all_results_dict(*keys)
     out_dir_hist = os.path.join("incohort_sociability", "histograms",
@@ -267,11 +455,20 @@ def get_incohort_sociability(ecohab_data, timeline, binsize, res_dir="",
 
     for idx_phase, ph in enumerate(all_phases):
         new_phase = phases[idx_phase]
-        for lab in bin_labels:
-            full_results[ph][lab],\
-                full_results_exp[ph][lab] = single_phase_results(data[ph][lab],
-                                                                 mice, cages,
-                                                                 time[ph][lab])
+        if isinstance(binsize, int) or isinstance(binsize, float):
+            overlaps, durations, alone = get_colocation(ecohab_data, mice,
+                                                        intervals[idx_phase])
+            for j, lab in enumerate(bin_labels):
+                t_start, t_end = intervals[idx_phase][j]
+                full_results[ph][lab],\
+                    full_results_exp[ph][lab] = colocation_results(
+                        overlaps[j].tolist(), durations[j].tolist(), mice,
+                        t_end - t_start)
+        else:
+            for lab in bin_labels:
+                full_results[ph][lab],\
+                    full_results_exp[ph][lab] = single_phase_results(
+                        data[ph][lab], mice, cages, time[ph][lab])
 
         write_binned_data(full_results[ph],
                           'incohort_sociability_measured_time',
@@ -25,15 +25,16 @@ def does_mouse1_push_out(m1_states, m1_times, antennas2, times2, config):
 
     if mice_in_different_spots(m1_states, m2_states):
         return False
+    topology = config.topology
     first_antenna = m1_states[0]
-    other_antennas = config.other_tunnel_antenna(first_antenna)
+    other_antennas = topology.other_tunnel_antennas.get(first_antenna, ())
     if not len(other_antennas):
         return False
     if len(other_antennas) == 1:
         opposite_antenna = other_antennas[0]
     else:
         for ant in other_antennas:
-            if ant not in config.internal_antennas:
+            if ant not in topology.internal_antennas:
                 other_antenna = ant
             else:
                 # if there is only one entrance antenna to the tunnel,
@@ -69,11 +70,12 @@ def check_mouse1_pushing(antennas1, times1, antennas2, times2,
         return False
     idx = 1
     dominance_counter = 0
+    tunnel = config.topology.antenna_tunnel
     while idx < len(antennas1):
         a1, a2 = antennas1[idx-1:idx+1]
         t1, t2 = times1[idx-1:idx+1]
-        if a1 != a2 and a1 in config.same_tunnel and a2 in config.same_tunnel:
-            if config.same_tunnel[a1] == config.same_tunnel[a2]:
+        if a1 != a2 and a1 in tunnel and a2 in tunnel:
+            if tunnel[a1] == tunnel[a2]:
                 temp_ants = [a1, a2]
                 temp_times = [t1, t2]
                 idx = idx + 1
@@ -109,20 +111,19 @@ def tube_dominance_single_phase(ecohab_data, timeline, phase, normalization):
     t_start, t_end = timeline.get_time_from_epoch(phase)
     dominance = np.zeros((len(mice), len(mice)))
     setup_config = ecohab_data.setup_config
+    times = {}
+    antennas = {}
+    for mouse in mice:
+        times[mouse], m_antennas = utils.get_times_antennas_arrays(
+            ecohab_data, mouse, t_start, t_end)
+        antennas[mouse] = m_antennas.tolist()
     for i, mouse1 in enumerate(mice):
-        m1_times, m1_antennas = utils.get_times_antennas(ecohab_data, mouse1,
-                                                         t_start, t_end)
         for j, mouse2 in enumerate(mice):
             if i != j:
-                m2_times, m2_antennas = utils.get_times_antennas(ecohab_data,
-                                                                 mouse2,
-                                                                 t_start,
-                                                                 t_end)
-
-                dominance[i, j] = check_mouse1_pushing(m1_antennas,
-                                                       m1_times,
-                                                       m2_antennas,
-                                                       m2_times,
+                dominance[i, j] = check_mouse1_pushing(antennas[mouse1],
+                                                       times[mouse1],
+                                                       antennas[mouse2],
+                                                       times[mouse2],
                                                        setup_config,
                                                        normalization)
     return dominance
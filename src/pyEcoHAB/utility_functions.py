@@ -8,6 +8,14 @@ from collections import OrderedDict
 import numpy as np
 
 
+VISITS_DTYPE = [("Address", "U30"),
+                ("Tag", "U15"),
+                ("AbsStartTimecode", float),
+                ("AbsEndTimecode", float),
+                ("VisitDuration", float),
+                ("ValidVisitSolution", bool)]
+
+
 # NamedDict class was originally written by Zbyszek Jędrzejewski-Szmek
 # and Avrama Blackwell for moose_nerp https://github.com/neurord/moose_nerp
 
@@ -154,18 +162,19 @@ def add_info_mice_filename(remove_mouse):
 
 
 def get_idx_pre(t0, times):
-    idxs = np.where(np.array(times) < t0)[0]
+    idxs = np.where(np.asarray(times) < t0)[0]
     if len(idxs):
         return idxs[-1]
     return None
 
 
 def get_idx_between(t0, t1, times):
-    return np.where((np.array(times) >= t0) & (np.array(times) < t1))[0]
+    times = np.asarray(times)
+    return np.where((times >= t0) & (times < t1))[0]
 
 
 def get_idx_post(t1, times):
-    idxs = np.where(np.array(times) > t1)[0]
+    idxs = np.where(np.asarray(times) > t1)[0]
     if len(idxs):
         return idxs[0]
     return None
@@ -181,12 +190,20 @@ def change_state(antennas):
 
 def get_times_antennas(e_data, mouse, t_1, t_2):
     if t_1 == 0 and t_2 == -1:
-        e_data.unmask_data()
+        e_data = e_data.unmasked()
         return e_data.get_times(mouse), e_data.get_antennas(mouse)
-    e_data.mask_data(t_1, t_2)
-    antennas, times = e_data.get_antennas(mouse), e_data.get_times(mouse)
-    e_data.unmask_data()
-    return times, antennas
+    window = e_data.window(t_1, t_2)
+    return window.get_times(mouse), window.get_antennas(mouse)
+
+
+def get_times_antennas_arrays(e_data, mouse, t_1, t_2):
+    """Return registration times and antennas of mouse as arrays
+    (views of the data, which should not be modified)."""
+    if t_1 == 0 and t_2 == -1:
+        e_data = e_data.unmasked()
+        return e_data.get_times_array(mouse), e_data.get_antennas_array(mouse)
+    window = e_data.window(t_1, t_2)
+    return window.get_times_array(mouse), window.get_antennas_array(mouse)
 
 
 def get_times_antennas_list_of_mice(ecohab_data, mice, t_1, t_2):
@@ -307,16 +324,26 @@ def get_indices(t_start, t_end, starts, ends):
 
 def get_ecohab_data_with_margin(ecohab_data, mouse, t_start, t_end,
                                 margin=12*3600):
+    adresses, starts, ends = get_ecohab_data_with_margin_arrays(ecohab_data,
+                                                                mouse,
+                                                                t_start,
+                                                                t_end,
+                                                                margin)
+    return adresses.tolist(), starts.tolist(), ends.tolist()
+
+
+def get_ecohab_data_with_margin_arrays(ecohab_data, mouse, t_start, t_end,
+                                       margin=12*3600):
+    """Return addresses, start times and end times of visits of mouse
+    as arrays (views of the data, which should not be modified)."""
     if t_start == 0 and t_end == -1:
-        return ecohab_data.get_visit_addresses(mouse),\
-            ecohab_data.get_starttimes(mouse),\
-            ecohab_data.get_endtimes(mouse)
-    ecohab_data.mask_data(t_start - margin, t_end + margin)
-    adresses = ecohab_data.get_visit_addresses(mouse)
-    starts = ecohab_data.get_starttimes(mouse)
-    ends = ecohab_data.get_endtimes(mouse)
-    ecohab_data.unmask_data()
-    return adresses, starts, ends
+        return ecohab_data.get_visit_addresses_array(mouse),\
+            ecohab_data.get_starttimes_array(mouse),\
+            ecohab_data.get_endtimes_array(mouse)
+    window = ecohab_data.window(t_start - margin, t_end + margin)
+    return window.get_visit_addresses_array(mouse),\
+        window.get_starttimes_array(mouse),\
+        window.get_endtimes_array(mouse)
 
 
 def prepare_data(ecohab_data, mice, times=None):
@@ -326,21 +353,70 @@ def prepare_data(ecohab_data, mice, times=None):
         mice = [mice]
     if times is None:
         ecohab_data.unmask_data()
-        times = (ecohab_data.get_starttimes(mice)[0],
-                 ecohab_data.get_endtimes(mice)[-1])
+        times = (float(ecohab_data.get_starttimes_array(mice)[0]),
+                 float(ecohab_data.get_endtimes_array(mice)[-1]))
     t_start, t_end = times
     for mouse in mice:
         data[mouse] = []
-        ads, sts, ens = get_ecohab_data_with_margin(ecohab_data, mouse,
-                                                    t_start, t_end)
+        ads, sts, ens = get_ecohab_data_with_margin_arrays(ecohab_data,
+                                                           mouse,
+                                                           t_start, t_end)
         idxs = get_indices(t_start, t_end, sts, ens)
-        for i in idxs:
-            data[mouse].append((ads[i],
-                                max(sts[i], t_start),
-                                min(ens[i], t_end)))
+        for ad, st, en in zip(ads[idxs].tolist(), sts[idxs].tolist(),
+                              ens[idxs].tolist()):
+            data[mouse].append((ad,
+                                max(st, t_start),
+                                min(en, t_end)))
     return data
 
 
+def prepare_data_bins(ecohab_data, mice, intervals, margin=12*3600):
+    """
+    Prepare masked data for many time intervals at once.
+
+    This is equivalent to [prepare_data(ecohab_data, mice, interval)
+    for interval in intervals], but visits of every animal are read in
+    once and assigned to intervals with searchsorted.
+
+    Args:
+       ecohab_data: Loader or Merger
+       mice: list of animal tags
+       intervals: list of (t_start, t_end) pairs
+       margin: float
+         visits starting earlier than margin before the interval are
+         ignored (as in get_ecohab_data_with_margin)
+    Returns:
+       list of dictionaries (mouse -> list of (address, start, end))
+    """
+    if not isinstance(mice, list):
+        mice = [mice]
+    out = [{} for interval in intervals]
+    if not len(intervals):
+        return out
+    t_starts = np.array([float(interval[0]) for interval in intervals])
+    t_ends = np.array([float(interval[1]) for interval in intervals])
+    view = ecohab_data.window(min(t_starts) - margin, max(t_ends) + margin)
+    for mouse in mice:
+        addresses = view.get_visit_addresses_array(mouse)
+        starts = view.get_starttimes_array(mouse)
+        ends = view.get_endtimes_array(mouse)
+        firsts = np.searchsorted(starts, t_starts - margin, side="left")
+        lasts = np.searchsorted(starts, t_ends + margin, side="left")
+        for i, (t_start, t_end) in enumerate(intervals):
+            sts = starts[firsts[i]:lasts[i]]
+            ens = ends[firsts[i]:lasts[i]]
+            idxs = firsts[i] + np.nonzero(((sts >= t_start) &
+                                           (sts < t_end)) |
+                                          ((ens >= t_start) &
+                                           (ens < t_end)))[0]
+            out[i][mouse] = [(ad, max(st, t_start), min(en, t_end))
+                             for ad, st, en
+                             in zip(addresses[idxs].tolist(),
+                                    starts[idxs].tolist(),
+                                    ends[idxs].tolist())]
+    return out
+
+
 def get_animal_position(times, antennas, mouse, threshold, same_pipe,
                         same_address, opposite_pipe, address, surrounding,
                         address_not_adjacent, internal_antennas):
@@ -406,6 +482,204 @@ def get_animal_position(times, antennas, mouse, threshold, same_pipe,
     return out
 
 
+def get_animal_position_array(times, antennas, mouse, threshold, topology):
+    """
+    Vectorized version of get_animal_position.
+
+    Transitions between consecutive antenna registrations are classified
+    with the lookup tables of a compiled setup (SetupTopology, see
+    SetupConfig.topology). Runs of internal antenna registrations are
+    found with run-length operations.
+
+    Returns:
+       visits of the animal (structured array with VISITS_DTYPE fields)
+       in the same order as get_animal_position
+    """
+    times = np.asarray(times, dtype=float)
+    n = len(times)
+    if n < 2:
+        return np.array([], dtype=VISITS_DTYPE)
+    codes = topology.encode(antennas)
+    internal = topology.internal[codes]
+
+    # runs of registrations by the same antenna
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = codes[1:] != codes[:-1]
+    run_starts = np.flatnonzero(new_run)
+    run_last = np.append(run_starts[1:], n) - 1
+    after_run = np.minimum(run_last[np.cumsum(new_run) - 1] + 1, n - 1)
+
+    # lookup tables: transition between antennas -> address, error for
+    # transitions get_animal_position can not classify
+    not_defined, error = -1, -2
+    table = np.where(topology.transitions < 0, error,
+                     topology.transition_address)
+    internal_address = np.where(topology.internal &
+                                (topology.internal_address == not_defined),
+                                error, topology.internal_address)
+
+    first = np.arange(n - 1)
+    # an internal antenna run following other registrations
+    after = first[~internal[:-1] & internal[1:]]
+    # an internal antenna run at the beginning or after another run
+    previous_internal = np.ones(n - 1, dtype=bool)
+    previous_internal[1:] = internal[:-2]
+    runs = first[internal[:-1] & new_run[:-1] & previous_internal]
+    # transitions between registrations by other antennas
+    pairs = first[~internal[:-1] & ~internal[1:] &
+                  (times[1:] - times[:-1] >= threshold)]
+    pair_address = table[codes[pairs], codes[pairs + 1]]
+
+    steps = np.concatenate([after, runs, pairs])
+    address_idx = np.concatenate([internal_address[codes[after + 1]],
+                                  internal_address[codes[runs]],
+                                  pair_address])
+    ends = np.concatenate([after_run[after + 1], after_run[runs],
+                           pairs + 1])
+    valid = np.concatenate([np.ones(len(after) + len(runs), dtype=bool),
+                            topology.transition_valid[codes[pairs],
+                                                      codes[pairs + 1]]])
+    keep = address_idx != not_defined
+    steps, address_idx = steps[keep], address_idx[keep]
+    ends, valid = ends[keep], valid[keep]
+    order = np.argsort(steps)
+    steps, address_idx = steps[order], address_idx[order]
+    ends, valid = ends[order], valid[order]
+    if np.any(address_idx == error):
+        # raise the same error as get_animal_position
+        step = steps[np.flatnonzero(address_idx == error)[0]]
+        raise KeyError(topology.decode(codes[step]))
+
+    out = np.zeros(len(steps), dtype=VISITS_DTYPE)
+    out["Address"] = np.array(list(topology.addresses) + [""])[address_idx]
+    out["Tag"] = mouse
+    out["AbsStartTimecode"] = times[steps]
+    out["AbsEndTimecode"] = times[ends]
+    out["VisitDuration"] = times[ends] - times[steps]
+    out["ValidVisitSolution"] = valid
+    return out
+
+
+def get_position_resume_index(antennas, internal_antennas):
+    """
+    Find the registration, from which get_animal_position has to be rerun,
+    if new registrations are appended to antennas.
+
+    get_animal_position always restarts from a registration that is not
+    an internal antenna registration, so the last visit is final unless
+    the last run of registrations is a run of internal antenna
+    registrations. This visit has been closed by the last registration
+    and will change, when new registrations are appended.
+
+    Args:
+       antennas: list
+         antenna registrations of an animal
+       internal_antennas: list
+    Returns:
+       index of the first registration to be processed again (int),
+       number of last visits to be discarded (0 or 1)
+    """
+    n = len(antennas)
+    if n < 2:
+        return 0, 0
+    last = antennas[-1]
+    if last not in internal_antennas:
+        return n - 1, 0
+    run_start = n - 1
+    while run_start > 0 and antennas[run_start - 1] == last:
+        run_start -= 1
+    if run_start == 0:
+        return 0, 1
+    if antennas[run_start - 1] not in internal_antennas:
+        return run_start - 1, 1
+    if run_start == n - 1:
+        return n - 1, 0
+    return run_start, 1
+
+
+class PositionStream(object):
+    """
+    Calculate visits of animals from consecutive chunks of registrations.
+
+    Registrations of every animal, which can still change its last visit
+    (the registration, from which get_animal_position would be rerun
+    according to get_position_resume_index), are kept between chunks.
+    Visits of every animal are emitted in the same order and with the
+    same timings as visits calculated by get_animal_position for the
+    whole recording at once.
+
+    Args:
+       setup_config: SetupConfig or ExperimentSetupConfig
+       threshold: float
+         minimum duration (in sec) of a visit. Default 2 s.
+
+    Example:
+       stream = PositionStream(setup_config)
+       for chunk in iter_registrations(path):
+           visits = stream.update(chunk)
+           ...
+       visits = stream.flush()
+    """
+    def __init__(self, setup_config, threshold=2.):
+        self.topology = setup_config.topology
+        self.threshold = threshold
+        self.pending = {}
+
+    def _visits(self, mouse, times, antennas):
+        return get_animal_position_array(times, antennas, mouse,
+                                         self.threshold, self.topology)
+
+    @staticmethod
+    def _sort(visits):
+        if not visits:
+            return np.array([], dtype=VISITS_DTYPE)
+        visits = np.concatenate(visits)
+        order = np.argsort(visits["AbsStartTimecode"], kind="stable")
+        return visits[order]
+
+    def update(self, registrations):
+        """
+        Process a chunk of registrations (a structured array with the
+        dtype of from_raw_data) recorded after all the previous chunks.
+
+        Returns:
+           visits completed by registrations in this chunk (a structured
+           array with VISITS_DTYPE fields sorted by start time)
+        """
+        registrations = registrations[np.argsort(registrations["Time"],
+                                                 kind="stable")]
+        tags = np.asarray(registrations["Tag"])
+        visits = []
+        for mouse in sorted(set(tags.tolist())):
+            mine = tags == mouse
+            times = np.asarray(registrations["Time"][mine], dtype=float)
+            antennas = np.asarray(registrations["Antenna"][mine])
+            if mouse in self.pending:
+                old_times, old_antennas = self.pending[mouse]
+                times = np.concatenate([old_times, times])
+                antennas = np.concatenate([old_antennas, antennas])
+            out = self._visits(mouse, times, antennas)
+            start, n_discard = get_position_resume_index(
+                antennas.tolist(), self.topology.internal_antennas)
+            visits.append(out[:len(out) - n_discard])
+            self.pending[mouse] = (times[start:], antennas[start:])
+        return self._sort(visits)
+
+    def flush(self):
+        """
+        Finish the calculation (e.g. at the end of the recording).
+
+        Returns:
+           all the visits, which have not been emitted yet (sorted by
+           start time)
+        """
+        visits = [self._visits(mouse, times, antennas)
+                  for mouse, (times, antennas)
+                  in sorted(self.pending.items())]
+        self.pending = {}
+        return self._sort(visits)
+
+
 def get_length(time_start, time_end, binsize):
     return int(np.ceil((time_end - time_start)/binsize))
 
@@ -451,6 +725,59 @@ def calc_excess(res, exp_res):
     return excess
 
 
+def get_bins(timeline, bins, shortest_phase, bin_labels):
+    """
+    Calculate edges of all time bins of length bins in dark and light
+    phases of the experiment. If bins are longer than the shortest phase,
+    the whole experiment is divided into consecutive bins instead.
+
+    Args:
+       timeline: Timeline
+       bins: float
+         bin length in seconds
+       shortest_phase: float
+         duration of the shortest phase
+       bin_labels: list
+         labels of consecutive bins in a phase
+    Returns:
+       phases: list of phase names with bin length
+       all_phases: list of phases (or numbered bins, if bins are longer
+         than the shortest phase)
+       bin_labels: list of bin labels
+       intervals: list (one per phase) of lists of (t_start, t_end) bins
+    """
+    all_phases = filter_dark_light(timeline.sections())
+    # you can not iterate by phases, if bins are longer than phases
+    if bins > shortest_phase:
+        t_start = timeline.get_time_from_epoch(all_phases[0])[0]
+        t_end = timeline.get_time_from_epoch(all_phases[-1])[-1]
+        bin_labels = [0.0]
+        all_phases = []
+        times = []
+        i = 1
+        while t_start < t_end:
+            times.append((t_start, t_start + bins))
+            all_phases.append("%d_x" % i)
+            i += 1
+            t_start += bins
+    else:
+        times = [timeline.get_time_from_epoch(phase)
+                 for phase in all_phases]
+    phases = []
+    intervals = []
+    for i, phase in enumerate(all_phases):
+        t_start, t_end = times[i]
+        phases.append("%s_%4.2fh" % (phase.replace(" ", "_"), bins/3600))
+        intervals.append([])
+        while t_start < t_end:
+            t_e = t_start + bins
+            if t_e > t_end:
+                t_e = t_end
+            intervals[-1].append((t_start, t_e))
+            t_start += bins
+    return phases, all_phases, bin_labels, intervals
+
+
 def get_dark_light_data(phase, timeline, ecohab_data, mice):
     if phase == "dark" or phase == "DARK" or phase == "Dark":
         phases = filter_dark(timeline.sections())
@@ -459,9 +786,9 @@ def get_dark_light_data(phase, timeline, ecohab_data, mice):
     out_phases = [phase]
     data = {mouse: [] for mouse in mice}
     total_time = 0
-    for i, ph in enumerate(phases):
-        time = timeline.get_time_from_epoch(ph)
-        out = prepare_data(ecohab_data, mice, time)
+    times = [timeline.get_time_from_epoch(ph) for ph in phases]
+    for time, out in zip(times, prepare_data_bins(ecohab_data, mice,
+                                                  times)):
         for mouse in mice:
             data[mouse].extend(out[mouse])
         total_time += (time[1] - time[0])
@@ -483,43 +810,19 @@ def prepare_binned_data(ecohab_data, timeline, bins, mice):
                                                        ecohab_data, mice)
         keys = [list(data.keys()), [0]]
     elif isinstance(bins, int) or isinstance(bins, float):
-        phases = []
-        all_phases = filter_dark_light(timeline.sections())
         shortest_phase = get_shortest_phase_duration(timeline)
-        # you can not iterate by phases, if bins are longer than phases
-        if bins > shortest_phase:
-            t_start = timeline.get_time_from_epoch(all_phases[0])[0]
-            t_end = timeline.get_time_from_epoch(all_phases[-1])[-1]
-            bin_labels = [0.0]
-            all_phases = []
-            times = []
-            i = 1
-            while t_start < t_end:
-                times.append((t_start, t_start + bins))
-                all_phases.append("%d_x" % i)
-                i += 1
-                t_start += bins
-        else:
-            all_phases = filter_dark_light(timeline.sections())
-            bin_labels = get_times(bins)
-            times = [timeline.get_time_from_epoch(phase)
-                     for phase in all_phases]
+        phases, all_phases, bin_labels, intervals = get_bins(
+            timeline, bins, shortest_phase, get_times(bins))
+        out = prepare_data_bins(ecohab_data, mice,
+                                [time for phase_intervals in intervals
+                                 for time in phase_intervals])
+        out = iter(out)
         for i, phase in enumerate(all_phases):
-            t_start, t_end = times[i]
-            phases.append("%s_%4.2fh" % (phase.replace(" ", "_"), bins/3600))
             data[phase] = OrderedDict()
             total_time[phase] = OrderedDict()
-            j = 0
-            while t_start < t_end:
-                t_e = t_start + bins
-                if t_e > t_end:
-                    t_e = t_end
-                time = [t_start, t_e]
-                data[phase][bin_labels[j]] = prepare_data(ecohab_data, mice,
-                                                          time)
+            for j, time in enumerate(intervals[i]):
+                data[phase][bin_labels[j]] = next(out)
                 total_time[phase][bin_labels[j]] = time[1] - time[0]
-                t_start += bins
-                j += 1
         keys = [all_phases, bin_labels]
     return phases, total_time, data, keys
 
@@ -567,6 +870,75 @@ def prepare_registrations(ecohab_data, mice, st, en):
     return directions
 
 
+def _registrations_in_bins(ecohab_data, mice, intervals):
+    """
+    For every animal return registration times and antennas (arrays)
+    read in once for all intervals together with indices of the first
+    and last registration in each interval and the index past the
+    registrations following the interval for the interval's duration.
+    """
+    t_starts = np.array([float(interval[0]) for interval in intervals])
+    t_ends = np.array([float(interval[1]) for interval in intervals])
+    t_afters = t_ends + (t_ends - t_starts)
+    view = ecohab_data.window(min(t_starts), max(t_afters))
+    for mouse in mice:
+        times = view.get_times_array(mouse)
+        antennas = view.get_antennas_array(mouse)
+        yield (mouse, times, antennas,
+               np.searchsorted(times, t_starts, side="left"),
+               np.searchsorted(times, t_ends, side="left"),
+               np.searchsorted(times, t_afters, side="left"))
+
+
+def prepare_registrations_bins(ecohab_data, mice, intervals):
+    """
+    Equivalent to [prepare_registrations(ecohab_data, mice, *interval)
+    for interval in intervals], but registrations of every animal
+    are read in once and assigned to intervals with searchsorted.
+    """
+    out = [{} for interval in intervals]
+    if not len(intervals):
+        return out
+    for mouse, times, antennas, firsts, lasts, afters in\
+            _registrations_in_bins(ecohab_data, mice, intervals):
+        for i in range(len(intervals)):
+            if lasts[i] < afters[i]:
+                last_antenna = antennas[lasts[i]:lasts[i] + 1].tolist()[0]
+            else:
+                last_antenna = None
+            out[i][mouse] = extract_directions(
+                times[firsts[i]:lasts[i]].tolist(),
+                antennas[firsts[i]:lasts[i]].tolist(),
+                last_antenna,
+                ecohab_data.directions)
+    return out
+
+
+def get_times_antennas_list_of_mice_bins(ecohab_data, mice, intervals):
+    """
+    Equivalent to [get_times_antennas_list_of_mice(ecohab_data, mice,
+    *interval) for interval in intervals], but registrations of every
+    animal are read in once and assigned to intervals with searchsorted.
+    """
+    out = [{} for interval in intervals]
+    if not len(intervals):
+        return out
+    for mouse, times, antennas, firsts, lasts, afters in\
+            _registrations_in_bins(ecohab_data, mice, intervals):
+        for i in range(len(intervals)):
+            out[i][mouse] = {
+                "times": times[firsts[i]:lasts[i]].tolist(),
+                "antennas": antennas[firsts[i]:lasts[i]].tolist()
+            }
+    return out
+
+
+BINNED_FUNCTIONS = {
+    prepare_registrations: prepare_registrations_bins,
+    get_times_antennas_list_of_mice: get_times_antennas_list_of_mice_bins,
+}
+
+
 def get_registrations_bins(ecohab_data, timeline, bins, mice,
                            function=prepare_registrations):
     total_time = OrderedDict()
@@ -578,46 +950,26 @@ def get_registrations_bins(ecohab_data, timeline, bins, mice,
         data_keys = [["ALL"], [0.0]]
         total_time["ALL"] = {0: time}
     elif isinstance(bins, int) or isinstance(bins, float):
-        phases = []
-        all_phases = filter_dark_light(timeline.sections())
         min_phase = int(get_shortest_phase_duration(timeline))
-        # you can not iterate by phases, if bins are longer than phases
-        if bins > min_phase:
-            t_start = timeline.get_time_from_epoch(all_phases[0])[0]
-            t_end = timeline.get_time_from_epoch(all_phases[-1])[-1]
-            bin_labels = [0.0]
-            all_phases = []
-            times = []
-            i = 1
-            while t_start < t_end:
-                times.append((t_start, t_start + bins))
-                all_phases.append("%d_x" % i)
-                i += 1
-                t_start += bins
+        phases, all_phases, bin_labels, intervals = get_bins(
+            timeline, bins, min_phase,
+            get_times(bins, time_start=0, time_end=min_phase))
+        all_intervals = [time for phase_intervals in intervals
+                         for time in phase_intervals]
+        if function in BINNED_FUNCTIONS:
+            out = BINNED_FUNCTIONS[function](ecohab_data, mice,
+                                             all_intervals)
         else:
-            all_phases = filter_dark_light(timeline.sections())
-            bin_labels = get_times(bins, time_start=0, time_end=min_phase)
-            times = [timeline.get_time_from_epoch(phase)
-                     for phase in all_phases]
+            out = [function(ecohab_data, mice, *time)
+                   for time in all_intervals]
+        out = iter(out)
         for i, phase in enumerate(all_phases):
-            t_start, t_end = times[i]
-            phases.append("%s_%4.2fh" % (phase.replace(" ", "_"),
-                                         bins/3600))
             data[phase] = OrderedDict()
             total_time[phase] = OrderedDict()
-            j = 0
-            while t_start < t_end:
-                t_e = t_start + bins
-                if t_e > t_end:
-                    t_e = t_end
-                time = (t_start, t_e)
-                data[phase][bin_labels[j]] = function(ecohab_data,
-                                                      mice,
-                                                      *time)
+            for j, time in enumerate(intervals[i]):
+                data[phase][bin_labels[j]] = next(out)
                 total_time[phase][bin_labels[j]] = time
-                t_start += bins
-                j += 1
-            data_keys = [all_phases, bin_labels]
+        data_keys = [all_phases, bin_labels]
     return phases, total_time, data, data_keys
 
 
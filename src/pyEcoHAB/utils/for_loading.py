@@ -4,9 +4,12 @@ import os
 import time
 import calendar
 import sys
+import hashlib
+import zipfile
 from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from pyEcoHAB.utility_functions import check_directory
+from pyEcoHAB.utility_functions import check_directory, VISITS_DTYPE
 
 h = u"antenna, incorrect transitions count, percentage of antenna recordings\n"
 
@@ -15,6 +18,20 @@ try:
 except NameError:
     basestring = str
 
+REGISTRATIONS_DTYPE = [("Id", int),
+                       ("Time", float),
+                       ("Antenna", "U15"),
+                       ("Duration", int),
+                       ("Tag", "U15")]
+
+DIAGNOSTICS_FNAMES = ["antenna_mismatches.csv",
+                      "breaks_in_registrations.csv",
+                      "incorrect_antenna_transitions.csv",
+                      "skipped_registrations.csv",
+                      "incorrect_tunnel_registrations.csv"]
+
+CACHE_VERSION = 4
+
 PAIRS = ["1 3", "1 4", "1 5", "1 6", "1 7", "2 4", "2 5", "2 6", "2 7", "2 8",
          "3 5", "3 6", "3 7", "3 8", "4 6", "4 7", "4 8", "5 7", "5 8", "6 8"]
 
@@ -93,6 +110,48 @@ def parse_fname(fname):
     return hour, date, datenext
 
 
+def fname_to_sec(fname):
+    """Return the beginning of the hour recorded in a data file
+    (in seconds since epoch) extracted from the data filename."""
+    hour, date, datenext = parse_fname(fname)
+    return calendar.timegm(time.strptime(date + hour[:2], '%Y%m%d%H'))
+
+
+def select_fnames(fnames, mask, margin=3600):
+    """
+    Select data files, which can contain registrations between mask[0]
+    and mask[-1]. Every data file records one hour of the experiment
+    starting at the hour in its filename. Files that start or end within
+    margin (in seconds) of the mask are kept, because registrations
+    close to the full hour can be saved in a neighbouring file. Files
+    with filenames in unknown formats are always kept.
+
+    Args:
+    fnames: list of strings
+       data filenames
+    mask: list or tuple of floats or None
+       time bounds in seconds since epoch. If mask is None all the
+       filenames are returned.
+    margin: float
+
+    Returns:
+       a list of filenames (in the order of fnames)
+    """
+    if not mask:
+        return list(fnames)
+    start, end = mask[0], mask[-1]
+    out = []
+    for fname in fnames:
+        try:
+            t_start = fname_to_sec(fname)
+        except ValueError:
+            out.append(fname)
+            continue
+        if t_start - margin <= end and t_start + 3600 + margin > start:
+            out.append(fname)
+    return out
+
+
 def print_human_time(tt):
     """convert seconds to date and time since epoch """
     st = time.gmtime(tt)
@@ -154,7 +213,7 @@ def read_single_file(dir_path, fname):
     for line in f:
         elements = line.split()
         if len(elements) == 5:
-            if hour == '23' and elements[1][:2] == '00':
+            if hour[:2] == '23' and elements[1][:2] == '00':
                 line = process_line_5_elements(elements, datenext)
             else:
                 line = process_line_5_elements(elements, date)
@@ -167,6 +226,279 @@ def read_single_file(dir_path, fname):
     return raw_data
 
 
+def _seconds_of_day(hms):
+    """Convert an array of %H:%M:%S strings to seconds since midnight."""
+    codes = np.ascontiguousarray(hms, dtype="U8")
+    codes = codes.view(np.uint32).reshape(len(hms), 8).astype(np.int64) - 48
+    digits = codes[:, [0, 1, 3, 4, 6, 7]]
+    if (np.char.str_len(hms) == 8).all() and (codes[:, [2, 5]] == 10).all()\
+       and ((digits >= 0) & (digits <= 9)).all():
+        hours = 10*digits[:, 0] + digits[:, 1]
+        minutes = 10*digits[:, 2] + digits[:, 3]
+        secs = 10*digits[:, 4] + digits[:, 5]
+        if (hours < 24).all() and (minutes < 60).all() and (secs < 62).all():
+            return 3600*hours + 60*minutes + secs
+    # non-standard time format -- parse every distinct second only once
+    keys, idx = np.unique(hms, return_inverse=True)
+    offsets = []
+    for key in keys:
+        tt = time.strptime(key, '%H:%M:%S')
+        offsets.append(tt.tm_hour*3600 + tt.tm_min*60 + tt.tm_sec)
+    return np.array(offsets, dtype=np.int64)[idx.ravel()]
+
+
+def times_to_sec(dates, times):
+    """
+    Convert arrays of dates (%Y%m%d) and times (%H:%M:%S, optionally
+    followed by milliseconds) to seconds since epoch.
+
+    This is a vectorized version of time_to_sec. Every distinct date is
+    parsed only once and times of day are decoded directly from their
+    digits (every distinct second is parsed only once, if times are not
+    zero-padded).
+
+    Args:
+    dates: a sequence of strings
+    times: a sequence of strings
+
+    Returns:
+       an array of floats
+    """
+    dates = np.asarray(dates, dtype=str)
+    times = np.asarray(times, dtype=str)
+    if not len(times):
+        return np.zeros(0)
+    parts = np.char.partition(times, ".")
+    hms, dots, msecs = parts[:, 0], parts[:, 1], parts[:, 2]
+
+    day_keys, day_idx = np.unique(dates, return_inverse=True)
+    day_offsets = np.array([calendar.timegm(time.strptime(day, '%Y%m%d'))
+                            for day in day_keys], dtype=np.int64)
+    seconds = day_offsets[day_idx.ravel()] + _seconds_of_day(hms)
+
+    has_msec = dots != ""
+    if not has_msec.any():
+        return seconds.astype(float)
+    if (np.char.find(msecs, ".") >= 0).any():
+        raise ValueError("Unknown time format")
+    less_than_sec = np.zeros(len(times))
+    less_than_sec[has_msec] = msecs[has_msec].astype(float)/1000
+    return seconds + less_than_sec
+
+
+def _as_string_list(values):
+    """Return string values (a single string or strings from a list)."""
+    if isinstance(values, basestring):
+        return [values]
+    return [value for value in values if isinstance(value, basestring)]
+
+
+def registrations_filter(tags, antennas, legal_tags="ALL",
+                         remove_antennas=None):
+    """
+    Return a bool array marking registrations, which should be kept:
+    registrations of legal_tags not recorded by remove_antennas.
+
+    Args:
+    tags: array of strings
+    antennas: array of strings
+    legal_tags: list or "ALL"
+        animal tags to be kept. Default "ALL". Keep all tags.
+    remove_antennas: list or None
+        antennas, which registrations should be removed
+
+    Returns:
+       a bool array
+    """
+    keep = np.ones(len(tags), dtype=bool)
+    if legal_tags != "ALL":
+        keep &= np.isin(tags, _as_string_list(legal_tags))
+    if remove_antennas is not None:
+        if not isinstance(remove_antennas, list):
+            remove_antennas = [remove_antennas]
+        keep &= ~np.isin(antennas, _as_string_list(remove_antennas))
+    return keep
+
+
+def read_single_file_array(dir_path, fname, legal_tags="ALL",
+                           remove_antennas=None):
+    """
+    Read in a single data file directly into a structured array.
+
+    This is a bulk equivalent of from_raw_data(read_single_file(dir_path,
+    fname)). The whole file is split into columns at once and timestamps
+    are decoded with times_to_sec. Both old data files (5 columns, the date
+    is taken from the filename) and new data files (date and time in
+    separate columns) are supported. Registrations of tags not listed in
+    legal_tags and registrations by remove_antennas are dropped before
+    the timestamps are decoded.
+
+    Args:
+    dir_path: string
+       directory containing the data file
+    fname: string
+       data filename
+    legal_tags: list or "ALL"
+       animal tags to be kept. Default "ALL". Keep all tags.
+    remove_antennas: list or None
+       antennas, which registrations are removed. Default None.
+
+    Returns:
+       a structured array of registrations (same as from_raw_data)
+    """
+    hour, date, datenext = parse_fname(fname)
+    with open(os.path.join(dir_path, fname), 'r') as f:
+        rows = [line.split() for line in f]
+    if not len(rows):
+        return np.zeros(0, dtype=REGISTRATIONS_DTYPE)
+    widths = set(len(row) for row in rows)
+    if min(widths) < 5:
+        raise(IOError('Unknown data format in file %s' % fname))
+    if widths == set([5]):
+        table = np.array(rows)
+        table = np.insert(table, 1, "", axis=1)
+    elif 5 not in widths and len(widths) == 1:
+        table = np.array(rows)[:, :6]
+    else:
+        table = np.array([row[:1] + [""] + row[1:] if len(row) == 5
+                          else row[:6] for row in rows])
+    if legal_tags != "ALL" or remove_antennas is not None:
+        table = table[registrations_filter(table[:, 5], table[:, 3],
+                                           legal_tags, remove_antennas)]
+        if not len(table):
+            return np.zeros(0, dtype=REGISTRATIONS_DTYPE)
+
+    dates, times = table[:, 1], table[:, 2]
+    old_format = dates == ""
+    if old_format.any():
+        old_dates = np.full(len(dates), date, dtype="U8")
+        if hour[:2] == '23':
+            after_midnight = np.char.startswith(times, "00")
+            old_dates[after_midnight] = datenext
+        dates = np.where(old_format, old_dates, dates)
+    if not old_format.all():
+        dates = np.char.replace(dates, ".", "")
+
+    data = np.zeros(len(table), dtype=REGISTRATIONS_DTYPE)
+    data["Id"] = table[:, 0].astype(int)
+    data["Time"] = times_to_sec(dates, times)
+    data["Antenna"] = table[:, 3]
+    data["Duration"] = table[:, 4].astype(int)
+    data["Tag"] = table[:, 5]
+    return data
+
+
+def get_n_jobs(n_jobs):
+    """Return number of worker processes, -1 or None means all CPUs."""
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return max(int(n_jobs), 1)
+
+
+def read_files(dir_path, fnames, n_jobs=1, legal_tags="ALL",
+               remove_antennas=None):
+    """
+    Read in data files with read_single_file_array.
+
+    Args:
+    dir_path: string
+       directory containing data files
+    fnames: list of strings
+       data filenames
+    n_jobs: int
+       number of worker processes parsing files concurrently.
+       -1 uses all available CPUs. By default files are read serially.
+    legal_tags: list or "ALL"
+       animal tags to be kept. Default "ALL". Keep all tags.
+    remove_antennas: list or None
+       antennas, which registrations are removed. Default None.
+
+    Returns:
+       a list of structured arrays, one per file (in order of fnames)
+    """
+    n_jobs = min(get_n_jobs(n_jobs), len(fnames))
+    if n_jobs <= 1:
+        return [read_single_file_array(dir_path, fname, legal_tags,
+                                       remove_antennas)
+                for fname in fnames]
+    chunksize = max(1, len(fnames)//(4*n_jobs))
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(read_single_file_array,
+                                 [dir_path]*len(fnames), fnames,
+                                 [legal_tags]*len(fnames),
+                                 [remove_antennas]*len(fnames),
+                                 chunksize=chunksize))
+
+
+def iter_registrations(path, chunk_hours=24, legal_tags="ALL",
+                       remove_antennas=None):
+    """
+    Iterate over registrations saved in data files in path in time-ordered
+    chunks, holding in memory only the data files of two consecutive
+    chunks.
+
+    Data files are grouped by the hour in their filenames into chunks
+    spanning chunk_hours. Registrations saved in a data file of one
+    chunk, but recorded after the beginning of the next chunk (e.g.
+    registrations after midnight saved in the 23:00 file), are moved to
+    the next chunk. Files of the next chunk are read in before a chunk
+    is yielded, and registrations saved there, but recorded before
+    the beginning of the next chunk, are moved to the current chunk.
+    Consecutive chunks do not overlap in time, unless registrations are
+    saved more than one chunk after they were recorded. Such registrations
+    can not be moved to an already yielded chunk and are yielded with
+    the earliest chunk that has not been yielded yet.
+
+    Args:
+    path: string
+       directory containing data files
+    chunk_hours: int
+       number of hours of the experiment in a chunk. Default 24.
+    legal_tags: list or "ALL"
+       animal tags to be kept. Default "ALL". Keep all tags.
+    remove_antennas: list or None
+       antennas, which registrations are removed. Default None.
+
+    Yields:
+       structured arrays of registrations sorted by time (the same
+       dtype as from_raw_data)
+    """
+    if chunk_hours <= 0:
+        raise ValueError("chunk_hours has to be positive")
+    starts = sorted((fname_to_sec(fname), fname)
+                    for fname in get_filenames(path))
+    groups = []
+    for t_start, fname in starts:
+        if not groups or t_start >= groups[-1][0] + chunk_hours*3600:
+            groups.append((t_start, []))
+        groups[-1][1].append(fname)
+
+    def read_group(fnames):
+        return np.concatenate(
+            [np.zeros(0, dtype=REGISTRATIONS_DTYPE)] +
+            [read_single_file_array(path, fname, legal_tags, remove_antennas)
+             for fname in fnames])
+
+    pending = np.zeros(0, dtype=REGISTRATIONS_DTYPE)
+    next_data = read_group(groups[0][1]) if groups else pending
+    for i in range(len(groups)):
+        data = np.concatenate([pending, next_data])
+        if i + 1 < len(groups):
+            boundary_time = groups[i + 1][0]
+            next_data = read_group(groups[i + 1][1])
+            late = next_data["Time"] < boundary_time
+            data = np.concatenate([data, next_data[late]])
+            next_data = next_data[~late]
+        data = data[np.argsort(data["Time"], kind="stable")]
+        if i + 1 < len(groups):
+            boundary = np.searchsorted(data["Time"], boundary_time)
+        else:
+            boundary = len(data)
+        pending = data[boundary:]
+        if boundary:
+            yield data[:boundary]
+
+
 def remove_one_antenna(data, antenna):
     """
     Remove animal tags registered by a specified antenna from 2D data array
@@ -197,9 +529,12 @@ def remove_antennas(data, antennas):
     if not isinstance(antennas, list):
         antennas = [antennas]
     new_data = data.copy()
-    if isinstance(antennas, list):
-        for antenna in antennas:
-            new_data = remove_one_antenna(new_data, antenna)
+    if isinstance(new_data, np.ndarray) and new_data.dtype.names:
+        return new_data[registrations_filter(new_data["Tag"],
+                                             new_data["Antenna"],
+                                             remove_antennas=antennas)]
+    for antenna in antennas:
+        new_data = remove_one_antenna(new_data, antenna)
     return new_data
 
 
@@ -211,8 +546,8 @@ def remove_ghost_tags(raw_data, legal_tags="ALL"):
     of incorrect  tags.
 
     Args:
-    raw_data: a list of lists or an 2D array
-        raw_data read by Loader._read_in_raw_data
+    raw_data: a list of lists, an 2D array or a structured array
+        raw_data read by read_single_file or read_single_file_array
     legal_tags: list
         animal tags to be kept in raw_data
         Default "ALL". Keep all tags.
@@ -227,6 +562,10 @@ def remove_ghost_tags(raw_data, legal_tags="ALL"):
     if isinstance(legal_tags, basestring):
         legal_tags = [legal_tags]
 
+    if isinstance(raw_data, np.ndarray) and raw_data.dtype.names:
+        return raw_data[registrations_filter(raw_data["Tag"],
+                                             raw_data["Antenna"],
+                                             legal_tags)]
     for d in raw_data:
         mouse = d[4]
         if mouse in legal_tags:
@@ -234,19 +573,96 @@ def remove_ghost_tags(raw_data, legal_tags="ALL"):
     return new_data[:]
 
 
-def check_antenna_presence(raw_data, setup_config, max_break):
+def registration_statistics(raw_data):
+    """
+    Calculate statistics of consecutive registrations of every animal
+    used by load-time diagnostics in a single pass over the data.
+
+    Registrations are grouped by animal tag (keeping their order
+    in raw_data) and every pair of consecutive registrations of an animal
+    is counted in a matrix indexed by codes of both antennas.
+
+    Args:
+    raw_data: structured array or BaseFunctions.Data
+       registrations (the same as returned by from_raw_data). Codes
+       of tags and antennas of Data are used directly.
+
+    Returns:
+       dictionary with:
+       antennas: list of antennas (antenna code is the position in list)
+       index: dictionary antenna -> code
+       codes: int array, antenna code of every registration
+       pairs: int matrix, count of consecutive registrations of an animal
+         by antennas (code1, code2)
+       fast_pairs: int matrix, count of consecutive registrations, where
+         the second registration starts before the first one has finished
+    """
     if not len(raw_data):
         raise Exception("Empty dataset")
-    all_times = raw_data['Time']
-    t_start = raw_data['Time'][0]
+    if hasattr(raw_data, "categories"):
+        tags = raw_data.column("Tag", codes=True)
+        labels = raw_data.categories("Antenna")
+        codes = raw_data.column("Antenna", codes=True).astype(int)
+    else:
+        tags = np.asarray(raw_data["Tag"])
+        labels, codes = np.unique(np.asarray(raw_data["Antenna"]),
+                                  return_inverse=True)
+        codes = codes.ravel()
+    n = len(labels)
+    order = np.argsort(tags, kind="stable")
+    same = tags[order][1:] == tags[order][:-1]
+    first, second = order[:-1][same], order[1:][same]
+    pair = codes[first]*n + codes[second]
+    times = _get_column(raw_data, "Time")
+    durations = _get_column(raw_data, "Duration")
+    fast = times[second] <= times[first] + durations[first]/1000
+    antennas = labels.tolist()
+    return {"antennas": antennas,
+            "index": {a: i for i, a in enumerate(antennas)},
+            "codes": codes,
+            "pairs": np.bincount(pair, minlength=n*n).reshape(n, n),
+            "fast_pairs": np.bincount(pair[fast],
+                                      minlength=n*n).reshape(n, n)}
+
+
+def _get_column(raw_data, name):
+    """Return column name of registrations (a structured array
+    or BaseFunctions.Data)."""
+    if hasattr(raw_data, "column"):
+        return raw_data.column(name)
+    return np.asarray(raw_data[name])
+
+
+def _count_unordered_pair(matrix, index, key):
+    """Count registrations by a pair of antennas "a1 a2" (a1 <= a2)
+    in any order."""
+    a1, a2 = key.split(" ")
+    if a1 > a2 or a1 not in index or a2 not in index:
+        return 0
+    i, j = index[a1], index[a2]
+    if i == j:
+        return int(matrix[i, i])
+    return int(matrix[i, j] + matrix[j, i])
+
+
+def check_antenna_presence(raw_data, setup_config, max_break, stats=None):
+    if not len(raw_data):
+        raise Exception("Empty dataset")
+    if stats is None:
+        stats = registration_statistics(raw_data)
+    all_times = _get_column(raw_data, "Time")
+    t_start = all_times[0]
     breaks = {}
-    t_end = raw_data['Time'][-1]
+    t_end = all_times[-1]
+    order = np.argsort(stats["codes"], kind="stable")
+    bounds = np.searchsorted(stats["codes"][order],
+                             np.arange(len(stats["antennas"]) + 1))
     for antenna in setup_config.all_antennas:
-        antenna_idx = []
-        for i, a in enumerate(raw_data['Antenna']):
-            if antenna == a:
-                antenna_idx.append(i)
-        times = all_times[antenna_idx]
+        code = stats["index"].get(antenna)
+        if code is None:
+            times = all_times[[]]
+        else:
+            times = all_times[order[bounds[code]:bounds[code + 1]]]
         breaks[antenna] = []
         if len(times):
             if times[0] - t_start > max_break:
@@ -260,28 +676,19 @@ def check_antenna_presence(raw_data, setup_config, max_break):
             if t_end - times[-1] > max_break:
                 breaks[antenna].append([np.round(times[-1]), t_end])
         else:
-            breaks[antenna].append([np.round(t_start),
-                                    raw_data['Time'][-1]])
+            breaks[antenna].append([np.round(t_start), t_end])
     return breaks
 
 
-def antenna_mismatch(raw_data, setup_config):
+def antenna_mismatch(raw_data, setup_config, stats=None):
     if not len(raw_data):
         raise Exception("Empty dataset")
-    pairs = setup_config.mismatched_pairs
-    all_times = raw_data['Time']
-    mice = set(raw_data['Tag'])
+    if stats is None:
+        stats = registration_statistics(raw_data)
     mismatches = OrderedDict()
-    for pair in pairs:
-        mismatches[pair] = 0
-    for mouse in mice:
-        mouse_idx = np.where(np.array(raw_data['Tag']) == mouse)[0]
-        times = all_times[mouse_idx]
-        ant = raw_data['Antenna'][mouse_idx]
-        for i, a in enumerate(ant[:-1]):
-            key = "%s %s" % (min(a, ant[i+1]), max(a, ant[i+1]))
-            if key in pairs:
-                mismatches[key] += 1
+    for pair in setup_config.mismatched_pairs:
+        mismatches[pair] = _count_unordered_pair(stats["pairs"],
+                                                 stats["index"], pair)
     return mismatches
 
 
@@ -301,27 +708,26 @@ def total_mismatches(mismatches):
     return out
 
 
-def skipped_registrations(raw_data, setup_config):
+def skipped_registrations(raw_data, setup_config, stats=None):
     if not len(raw_data):
         raise Exception("Empty dataset")
+    if stats is None:
+        stats = registration_statistics(raw_data)
     one_skipped = setup_config.skipped_one()
     skipped_two = setup_config.skipped_two()
     skipped_more = setup_config.skipped_more()
 
-    mice = set(raw_data['Tag'])
     mismatches = OrderedDict([("skipped one", 0), ("skipped two", 0),
                               ("skipped more", 0)])
-    for mouse in mice:
-        mouse_idx = np.where(np.array(raw_data['Tag']) == mouse)[0]
-        ant = raw_data['Antenna'][mouse_idx]
-        for i, a in enumerate(ant[:-1]):
-            key = "%s %s" % (a, ant[i+1])
-            if key in one_skipped:
-                mismatches["skipped one"] += 1
-            elif key in skipped_more:
-                mismatches["skipped more"] += 1
-            elif key in skipped_two:
-                mismatches["skipped two"] += 1
+    antennas = stats["antennas"]
+    for i, j in zip(*np.nonzero(stats["pairs"])):
+        key = "%s %s" % (antennas[i], antennas[j])
+        if key in one_skipped:
+            mismatches["skipped one"] += int(stats["pairs"][i, j])
+        elif key in skipped_more:
+            mismatches["skipped more"] += int(stats["pairs"][i, j])
+        elif key in skipped_two:
+            mismatches["skipped two"] += int(stats["pairs"][i, j])
     return mismatches
 
 
@@ -409,8 +815,8 @@ def run_diagnostics(raw_data, max_break, res_dir, setup_config):
     These parameters will be saved in "diagnostics" directory.
 
     Args:
-    raw_data:  dictionary of sequences
-       data read in from data files
+    raw_data: structured array or BaseFunctions.Data
+       registrations read in from data files
     max_break: float
        maximum break in single antenna registrations (in sec)
     res_dir: string
@@ -436,17 +842,21 @@ def run_diagnostics(raw_data, max_break, res_dir, setup_config):
         text showing count and percentage of cases, when two entrance antennas
         to the same tunnel registered an animal simultaneously
     """
-    mismatches = antenna_mismatch(raw_data, setup_config)
-    string_1 = save_mismatches(mismatches, len(raw_data["Antenna"]),
+    stats = registration_statistics(raw_data)
+    mismatches = antenna_mismatch(raw_data, setup_config, stats)
+    string_1 = save_mismatches(mismatches, len(raw_data),
                                res_dir)
-    antenna_breaks = check_antenna_presence(raw_data, setup_config, max_break)
+    antenna_breaks = check_antenna_presence(raw_data, setup_config, max_break,
+                                            stats)
     string_2 = save_antenna_breaks(antenna_breaks, res_dir)
     tot_mismatches = total_mismatches(mismatches)
-    counters = Counter(raw_data["Antenna"])
+    counts = np.bincount(stats["codes"], minlength=len(stats["antennas"]))
+    counters = Counter(dict(zip(stats["antennas"], counts.tolist())))
     string_3 = save_total_mismatches(tot_mismatches, counters, res_dir)
-    skip = skipped_registrations(raw_data, setup_config)
-    string_4 = save_skipped_registrations(skip, len(raw_data["Tag"]), res_dir)
-    count, total_count = incorrect_tunnel_registrations(raw_data, setup_config)
+    skip = skipped_registrations(raw_data, setup_config, stats)
+    string_4 = save_skipped_registrations(skip, len(raw_data), res_dir)
+    count, total_count = incorrect_tunnel_registrations(raw_data, setup_config,
+                                                        stats)
     header = u"tunnel, count, percentage of all passings through the tunnel\n"
     string_5 = save_mismatches(count, total_count, res_dir,
                                fname="incorrect_tunnel_registrations.csv",
@@ -454,25 +864,21 @@ def run_diagnostics(raw_data, max_break, res_dir, setup_config):
     return string_1, string_2, string_3, string_4, string_5
 
 
-def incorrect_tunnel_single_mouse(keys, antennas, times, durations):
-    count = {}
-    total_count = {}
-    for key in keys:
-        count[key] = 0
-        total_count[key] = 0
-    for i, a1 in enumerate(antennas[:-1]):
-        a2 = antennas[i+1]
-        key = "%s %s" % (min(a1, a2), max(a1, a2))
-        if key in keys:
-            t1, t2 = times[i], times[i+1]
-            d1 = durations[i]/1000
-            total_count[key] += 1
-            if t2 <= t1 + d1:
-                count[key] += 1
-    return count, total_count
+def save_diagnostics(diagnostics, res_dir):
+    """
+    Save texts returned by run_diagnostics in "diagnostics" directory
+    (e.g. diagnostics read in from a cache).
+    """
+    new_path = check_directory(res_dir, "diagnostics")
+    for fname, text in zip(DIAGNOSTICS_FNAMES, diagnostics):
+        f = open(os.path.join(new_path, fname), "w")
+        f.write(text)
+        f.close()
 
 
-def incorrect_tunnel_registrations(raw_data, setup_config):
+def incorrect_tunnel_registrations(raw_data, setup_config, stats=None):
+    if stats is None and len(raw_data):
+        stats = registration_statistics(raw_data)
     count = OrderedDict()
     directions = setup_config.directions
     total_count = {}
@@ -481,20 +887,11 @@ def incorrect_tunnel_registrations(raw_data, setup_config):
         key = "%s %s" % (min(a1, a2), max(a1, a2))
         count[key] = 0
         total_count[key] = 0
-    mice = set(raw_data['Tag'])
-
-    for mouse in mice:
-        mouse_idx = np.where(np.array(raw_data['Tag']) == mouse)[0]
-        times1 = raw_data["Time"][mouse_idx]
-        antennas1 = raw_data['Antenna'][mouse_idx]
-        durations1 = raw_data["Duration"][mouse_idx]
-        out_count, out_tot_count = incorrect_tunnel_single_mouse(count.keys(),
-                                                                 antennas1,
-                                                                 times1,
-                                                                 durations1)
-        for key in count:
-            count[key] += out_count[key]
-            total_count[key] += out_tot_count[key]
+        if stats is not None:
+            count[key] = _count_unordered_pair(stats["fast_pairs"],
+                                               stats["index"], key)
+            total_count[key] = _count_unordered_pair(stats["pairs"],
+                                                     stats["index"], key)
     return count, total_count
 
 
@@ -511,22 +908,11 @@ def from_raw_data(raw_data):
     new_data = []
     for row in raw_data:
         new_data.append(transform_raw(row))
-    data_type = [("Id", int),
-                 ("Time", float),
-                 ("Antenna", "U15"),
-                 ("Duration", int),
-                 ("Tag", "U15")]
-    return np.array(new_data, dtype=data_type)
+    return np.array(new_data, dtype=REGISTRATIONS_DTYPE)
 
 
 def transform_visits(data):
-    data_type = [("Address", "U30"),
-                 ("Tag", "U15"),
-                 ("AbsStartTimecode", float),
-                 ("AbsEndTimecode", float),
-                 ("VisitDuration", float),
-                 ("ValidVisitSolution", bool)]
-    return np.array(data, dtype=data_type)
+    return np.array(data, dtype=VISITS_DTYPE)
 
 
 def rename_antennas(name, dataset):
@@ -536,12 +922,212 @@ def rename_antennas(name, dataset):
     return new_data
 
 
+def is_sorted(values):
+    """Check, if values (an array) are sorted in non-decreasing order."""
+    values = np.asarray(values)
+    return bool(np.all(values[1:] >= values[:-1]))
+
+
+def _merge_two(data1, data2, column):
+    """Merge two structured arrays sorted by column. Entries of data1
+    precede entries of data2 with the same value of column."""
+    position = (np.searchsorted(data1[column], data2[column], side="right")
+                + np.arange(len(data2)))
+    dtype = np.concatenate([data1[:0], data2[:0]]).dtype
+    out = np.empty(len(data1) + len(data2), dtype=dtype)
+    from_data1 = np.ones(len(out), dtype=bool)
+    from_data1[position] = False
+    out[position] = data2
+    out[from_data1] = data1
+    return out
+
+
+def merge_sorted(data_sets, column="Time"):
+    """
+    Merge structured arrays into one array sorted by column.
+
+    Every array is sorted separately (only if it is not sorted already)
+    and sorted arrays are merged pairwise. The result is the same as
+    a stable sort of concatenated arrays, but for already sorted inputs
+    (e.g. hourly data files or data of different Loaders) the cost is
+    linear in the number of entries times log of the number of arrays.
+
+    Args:
+    data_sets: list of structured arrays
+    column: str
+       name of the column to sort by. Default "Time".
+
+    Returns:
+       a structured array
+    """
+    parts = []
+    for data in data_sets:
+        if not is_sorted(data[column]):
+            data = data[np.argsort(data[column], kind="stable")]
+        parts.append(data)
+    if not parts:
+        return np.zeros(0, dtype=REGISTRATIONS_DTYPE)
+    while len(parts) > 1:
+        parts = [_merge_two(parts[i], parts[i + 1], column)
+                 if i + 1 < len(parts) else parts[i]
+                 for i in range(0, len(parts), 2)]
+    return parts[0]
+
+
 def append_data_sources(data_sets):
-    new_data = np.concatenate(data_sets)
-    new_data.sort(order="Time")
+    """
+    Combine registrations from different data sources (e.g. Loaders)
+    into one array sorted by registration time. Registrations with
+    equal times are ordered by the remaining fields (as in
+    numpy.sort(order="Time")).
+    """
+    new_data = merge_sorted(data_sets, "Time")
+    times = new_data["Time"]
+    tied = np.zeros(len(new_data), dtype=bool)
+    tied[1:] = times[1:] == times[:-1]
+    tied[:-1] |= tied[1:]
+    if tied.any():
+        rows = np.where(tied)[0]
+        tied_data = new_data[rows]
+        names = ["Time"] + [name for name in new_data.dtype.names
+                            if name != "Time"]
+        order = np.lexsort([tied_data[name] for name in reversed(names)])
+        new_data[rows] = tied_data[order]
     return new_data
 
 
+def cache_fname(cache_dir, path):
+    """
+    Return path to the cache file of data directory path.
+    """
+    name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, "pyEcoHAB_cache_%s.npz" % name[:16])
+
+
+def file_stats(path, fnames):
+    """
+    Return a dictionary fname -> (size, modification time in ns)
+    of data files fnames in path.
+    """
+    out = {}
+    for fname in fnames:
+        stat = os.stat(os.path.join(path, fname))
+        out[fname] = (stat.st_size, stat.st_mtime_ns)
+    return out
+
+
+def cache_key(path, fnames, setup_config, **params):
+    """
+    Calculate a key describing all inputs of a Loader: names, sizes
+    and modification times of data files, contents of the setup config
+    and Loader parameters (e.g. visit_threshold, legal_tags,
+    remove_antennas). If any of them changes, the key changes as well.
+    """
+    stats = file_stats(path, fnames)
+    files = [(fname,) + stats[fname] for fname in sorted(stats)]
+    config = [(sec, setup_config.items(sec))
+              for sec in setup_config.sections()]
+    params = sorted(params.items())
+    out = repr((CACHE_VERSION, files, config, params))
+    return hashlib.sha1(out.encode("utf-8")).hexdigest()
+
+
+def _save_npz(fname, **arrays):
+    """Save arrays in an .npz file replacing the file atomically."""
+    check_directory(os.path.dirname(os.path.abspath(fname)))
+    temp_fname = "%s.%d.tmp.npz" % (fname[:-4], os.getpid())
+    np.savez(temp_fname, **arrays)
+    os.replace(temp_fname, fname)
+
+
+def load_cache(fname, key):
+    """
+    Read in registrations, visits and the state of data files saved by
+    save_cache. Registrations and visits are returned as pairs
+    (structured array with codes, dictionary column -> table of labels),
+    see BaseFunctions.DataBase.encoded, the state of data files
+    as a dictionary fname -> (size, modification time, number of rows).
+    Returns None, if there is no cache file or the cache was calculated
+    for different inputs (key).
+    """
+    try:
+        with np.load(fname, allow_pickle=False) as cached:
+            if cached["key"].item() != key:
+                return None
+            out = []
+            for name in ["registrations", "visits"]:
+                data = cached[name]
+                categories = {}
+                for column in data.dtype.names:
+                    labels = "%s_labels_%s" % (name, column)
+                    if labels in cached.files:
+                        categories[column] = cached[labels]
+                out.append((data, categories))
+            files = {}
+            for row in cached["files"]:
+                files[str(row["fname"])] = (int(row["size"]),
+                                            int(row["mtime"]),
+                                            int(row["rows"]))
+            return out[0], out[1], files
+    except (IOError, OSError, ValueError, KeyError, zipfile.BadZipfile):
+        return None
+
+
+def save_cache(fname, key, registrations, visits, files):
+    """
+    Save registrations and visits (BaseFunctions.DataBase objects stored
+    as codes and tables of labels) and the state of data files
+    (a dictionary fname -> (size, modification time, number of rows read
+    in)) in an .npz file.
+    """
+    length = max([1] + [len(name) for name in files])
+    files = sorted((name,) + tuple(state) for name, state in files.items())
+    arrays = {"files": np.array(files, dtype=[("fname", "U%d" % length),
+                                              ("size", "i8"),
+                                              ("mtime", "i8"),
+                                              ("rows", "i8")])}
+    for name, dataset in [("registrations", registrations),
+                          ("visits", visits)]:
+        data, categories = dataset.encoded()
+        arrays[name] = data
+        for column, labels in categories.items():
+            arrays["%s_labels_%s" % (name, column)] = labels
+    _save_npz(fname, key=np.array(key), **arrays)
+
+
+def diagnostics_cache_fname(fname):
+    """
+    Return path to the file with diagnostics of cache file fname.
+    """
+    return "%s_diagnostics.npz" % fname[:-4]
+
+
+def load_diagnostics_cache(fname, key):
+    """
+    Read in diagnostics texts saved by save_diagnostics_cache for cache
+    file fname. Returns None, if diagnostics have not been saved or were
+    calculated for different inputs (key).
+    """
+    try:
+        with np.load(diagnostics_cache_fname(fname),
+                     allow_pickle=False) as cached:
+            if cached["key"].item() != key:
+                return None
+            return cached["diagnostics"].tolist()
+    except (IOError, OSError, ValueError, KeyError, zipfile.BadZipfile):
+        return None
+
+
+def save_diagnostics_cache(fname, key, diagnostics):
+    """
+    Save diagnostics texts of cache file fname. Diagnostics are saved
+    in a separate file, so that registrations and visits can be cached
+    before diagnostics are calculated.
+    """
+    _save_npz(diagnostics_cache_fname(fname), key=np.array(key),
+              diagnostics=np.array(diagnostics))
+
+
 class NamedDict(dict):
     """Creates a python dict with a name and attribute access of keys.
 
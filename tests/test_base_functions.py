@@ -0,0 +1,283 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+from __future__ import print_function, division, absolute_import
+import unittest
+import numpy as np
+
+from pyEcoHAB.BaseFunctions import Data, Visits, recode
+from pyEcoHAB.utils.for_loading import REGISTRATIONS_DTYPE
+
+
+class TestGetProperty(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        data = [(1, 1., "1", 100, "mouse_1"),
+                (2, 2., "2", 200, "mouse_2"),
+                (3, 3., "3", 300, "mouse_1"),
+                (4, 4., "4", 400, "mouse_3"),
+                (5, 5., "5", 500, "mouse_2"),
+                (6, 6., "6", 600, "mouse_1")]
+        cls.data = Data(np.array(data, dtype=REGISTRATIONS_DTYPE), None)
+
+    def test_single_mouse(self):
+        self.assertEqual(self.data.get_times("mouse_1"), [1., 3., 6.])
+
+    def test_list_of_mice(self):
+        out = self.data.get_antennas(["mouse_2", "mouse_1"])
+        self.assertEqual(out, ["1", "2", "3", "5", "6"])
+
+    def test_missing_mouse(self):
+        self.assertEqual(self.data.get_times("mouse_4"), [])
+
+    def test_durations(self):
+        self.assertEqual(self.data.get_durations("mouse_2"), [200, 500])
+
+    def test_float(self):
+        out = self.data.getproperty("mouse_3", "Duration", "float")
+        self.assertEqual(out, [400.])
+        self.assertIsInstance(out[0], float)
+
+    def test_masked(self):
+        self.data.mask_data((2., 5.5))
+        out = self.data.get_times(["mouse_1", "mouse_2"])
+        self.data.unmask_data()
+        self.assertEqual(out, [2., 3., 5.])
+
+    def test_masked_empty(self):
+        self.data.mask_data((6.5, 7.))
+        out = self.data.get_times("mouse_1")
+        self.data.unmask_data()
+        self.assertEqual(out, [])
+
+
+class TestGetPropertyArray(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        data = [(1, 1., "1", 100, "mouse_1"),
+                (2, 2., "2", 200, "mouse_2"),
+                (3, 3., "3", 300, "mouse_1"),
+                (4, 4., "4", 400, "mouse_3"),
+                (5, 5., "5", 500, "mouse_2"),
+                (6, 6., "6", 600, "mouse_1")]
+        cls.data = Data(np.array(data, dtype=REGISTRATIONS_DTYPE), None)
+
+    def test_array(self):
+        out = self.data.get_times_array("mouse_1")
+        self.assertIsInstance(out, np.ndarray)
+        self.assertEqual(out.tolist(), [1., 3., 6.])
+
+    def test_view(self):
+        out1 = self.data.get_times_array("mouse_2")
+        out2 = self.data.get_times_array("mouse_2")
+        self.assertTrue(np.shares_memory(out1, out2))
+
+    def test_read_only(self):
+        out = self.data.get_times_array("mouse_2")
+        self.assertFalse(out.flags.writeable)
+        self.assertRaises(ValueError, out.__setitem__, 0, 10.)
+        self.assertEqual(self.data.get_times("mouse_2"), [2., 5.])
+
+    def test_codes_read_only(self):
+        out = self.data.getproperty_codes("mouse_1", "Tag")
+        self.assertRaises(ValueError, out.__setitem__, 0, 1)
+
+    def test_list_of_mice(self):
+        out = self.data.get_durations_array(["mouse_3", "mouse_2"])
+        self.assertEqual(out.tolist(), [200, 400, 500])
+
+    def test_masked(self):
+        self.data.mask_data((2., 6.))
+        out = self.data.get_times_array("mouse_1")
+        self.data.unmask_data()
+        self.assertEqual(out.tolist(), [3.])
+
+    def test_same_as_list(self):
+        for mice in ["mouse_1", ["mouse_1", "mouse_3"], "mouse_4"]:
+            self.assertEqual(self.data.get_antennas_array(mice).tolist(),
+                             self.data.get_antennas(mice))
+
+
+class TestWindow(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        data = [(1, 1., "1", 100, "mouse_1"),
+                (2, 2., "2", 200, "mouse_2"),
+                (3, 3., "3", 300, "mouse_1"),
+                (4, 3., "4", 400, "mouse_3"),
+                (5, 5., "5", 500, "mouse_2"),
+                (6, 6., "6", 600, "mouse_1")]
+        cls.data = Data(np.array(data, dtype=REGISTRATIONS_DTYPE), None)
+        unsorted = [data[i] for i in [3, 0, 5, 1, 4, 2]]
+        cls.unsorted = Data(np.array(unsorted, dtype=REGISTRATIONS_DTYPE),
+                            None)
+
+    def test_window(self):
+        window = self.data.window(2., 5.)
+        self.assertEqual(window.get_times(["mouse_1", "mouse_2",
+                                           "mouse_3"]), [2., 3., 3.])
+
+    def test_original_unmasked(self):
+        self.data.window(2., 5.)
+        self.assertIsNone(self.data.mask)
+        self.assertEqual(len(self.data.get_times("mouse_1")), 3)
+
+    def test_same_as_mask(self):
+        for mask in [(0., 10.), (3., 3.), (3., 5.), (3.5, 4.), (6., 7.),
+                     (5., 2.)]:
+            window = self.data.window(*mask)
+            self.data.mask_data(mask)
+            out = self.data.get_antennas(["mouse_1", "mouse_2", "mouse_3"])
+            self.data.unmask_data()
+            self.assertEqual(window.get_antennas(["mouse_1", "mouse_2",
+                                                  "mouse_3"]), out)
+
+    def test_unsorted(self):
+        window = self.unsorted.window(2.5, 5.5)
+        self.unsorted.mask_data((2.5, 5.5))
+        out = self.unsorted.get_antennas(["mouse_1", "mouse_2", "mouse_3"])
+        self.unsorted.unmask_data()
+        self.assertEqual(window.get_antennas(["mouse_1", "mouse_2",
+                                              "mouse_3"]), out)
+
+    def test_unmasked(self):
+        self.data.mask_data((2., 5.))
+        view = self.data.unmasked()
+        self.assertEqual(view.get_times("mouse_1"), [1., 3., 6.])
+        self.assertEqual(self.data.get_times("mouse_1"), [3.])
+        self.data.unmask_data()
+
+    def test_two_windows(self):
+        window_1 = self.data.window(0, 3.)
+        window_2 = self.data.window(3., 10.)
+        self.assertEqual(window_1.get_times("mouse_1"), [1.])
+        self.assertEqual(window_2.get_times("mouse_1"), [3., 6.])
+
+
+class TestVisitsGetProperty(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        dtype = [("Address", "U30"), ("Tag", "U15"),
+                 ("AbsStartTimecode", float), ("AbsEndTimecode", float),
+                 ("VisitDuration", float), ("ValidVisitSolution", bool)]
+        data = [("cage A", "mouse_1", 1., 2., 1., True),
+                ("cage B", "mouse_2", 1.5, 3., 1.5, True),
+                ("cage C", "mouse_1", 2., 4., 2., True)]
+        cls.visits = Visits(np.array(data, dtype=dtype), None)
+
+    def test_addresses(self):
+        self.assertEqual(self.visits.get_visit_addresses("mouse_1"),
+                         ["cage A", "cage C"])
+
+    def test_starttimes(self):
+        self.assertEqual(self.visits.get_starttimes(["mouse_1", "mouse_2"]),
+                         [1., 1.5, 2.])
+
+
+class TestCategorical(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.raw = np.array([(1, 1., "3", 100, "mouse_2"),
+                            (2, 2., "1", 200, "mouse_1"),
+                            (3, 3., "3", 300, "mouse_1"),
+                            (4, 4., "2", 400, "mouse_2")],
+                           dtype=REGISTRATIONS_DTYPE)
+        cls.data = Data(cls.raw, None)
+
+    def test_categories(self):
+        self.assertEqual(self.data.categories("Antenna").tolist(),
+                         ["1", "2", "3"])
+        self.assertEqual(self.data.categories("Tag").tolist(),
+                         ["mouse_1", "mouse_2"])
+
+    def test_codes(self):
+        out = self.data.get_antenna_codes(["mouse_1", "mouse_2"])
+        self.assertEqual(out.tolist(), [2, 0, 2, 1])
+
+    def test_codes_single_mouse(self):
+        out = self.data.get_antenna_codes("mouse_2")
+        self.assertEqual(out.tolist(), [2, 1])
+
+    def test_small_codes(self):
+        self.assertEqual(self.data.get_antenna_codes("mouse_1").itemsize, 1)
+
+    def test_encode(self):
+        self.assertEqual(self.data.encode("Antenna", ["3", "4", 1]).tolist(),
+                         [2, -1, -1])
+        self.assertEqual(self.data.encode("Tag", "mouse_2").tolist(), [1])
+
+    def test_decoded_data(self):
+        self.assertEqual(self.data.data.dtype, self.raw.dtype)
+        self.assertEqual(self.data.data.tolist(), self.raw.tolist())
+
+    def test_strings(self):
+        self.assertEqual(self.data.get_antennas("mouse_2"), ["3", "2"])
+
+    def test_data_not_cached(self):
+        self.assertIsNot(self.data.data, self.data.data)
+
+    def test_column(self):
+        self.assertEqual(self.data.column("Antenna").tolist(),
+                         ["3", "1", "3", "2"])
+        self.assertEqual(self.data.column("Antenna", codes=True).tolist(),
+                         [2, 0, 2, 1])
+        self.assertEqual(self.data.column("Time").tolist(),
+                         [1., 2., 3., 4.])
+
+    def test_len(self):
+        self.assertEqual(len(self.data), 4)
+
+    def test_encoded(self):
+        codes, categories = self.data.encoded()
+        data = Data(codes, None, categories)
+        self.assertEqual(data.data.tolist(), self.raw.tolist())
+        self.assertEqual(data.data.dtype, self.raw.dtype)
+
+    def test_encoded_read_only(self):
+        codes, categories = self.data.encoded()
+        self.assertFalse(codes.flags.writeable)
+
+    def test_cut_drops_labels(self):
+        data = Data(self.raw, [2.5, 5.])
+        self.assertEqual(data.categories("Antenna").tolist(), ["2", "3"])
+        self.assertEqual(data.data.tolist(), self.raw[2:].tolist())
+
+    def test_cut_encoded(self):
+        codes, categories = self.data.encoded()
+        data = Data(codes, [0., 2.5], categories)
+        self.assertEqual(data.categories("Tag").tolist(),
+                         ["mouse_1", "mouse_2"])
+        self.assertEqual(data.data.tolist(), self.raw[:2].tolist())
+        self.assertEqual(self.data.data.tolist(), self.raw.tolist())
+
+    def test_get_data(self):
+        out = self.data.get_data("mouse_1")
+        self.assertEqual(out.dtype, self.raw.dtype)
+        self.assertEqual(out.tolist(), self.raw[1:3].tolist())
+
+    def test_recode(self):
+        other = Data(np.array([(5, 5., "4", 500, "mouse_3"),
+                               (6, 6., "1", 600, "mouse_1")],
+                              dtype=REGISTRATIONS_DTYPE), None)
+        datasets, categories = recode([self.data.encoded(),
+                                       other.encoded()])
+        self.assertEqual(categories["Antenna"].tolist(),
+                         ["1", "2", "3", "4"])
+        data = Data(np.concatenate(datasets), None, categories)
+        self.assertEqual(data.data.tolist(),
+                         self.raw.tolist() + other.data.tolist())
+
+    def test_data_read_only(self):
+        def write():
+            self.data.data["Tag"][0] = "mouse_2"
+        self.assertRaises(ValueError, write)
+        self.assertEqual(self.data.data.tolist(), self.raw.tolist())
+
+    def test_set_data(self):
+        data = Data(self.raw, None)
+        old = data.data
+        data.data = self.raw[:2]
+        self.assertEqual(len(old), 4)
+        self.assertEqual(data.data.tolist(), self.raw[:2].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,6 +39,70 @@ class TestSingleAntennaStats(unittest.TestCase):
                                                   times[1], "8", 900)
         self.assertEqual(result, ([0, 0, 0, 1], [0, 0, 0, 1026/1000]))
 
+    def test_array_shape(self):
+        times = self.config.get_time_from_epoch("ALL")
+        count, durations = self.data.get_registration_stats_array(
+            ["mouse_1", "mouse_2"], times[0], times[1], ["1", "8", "9"], 900)
+        self.assertEqual(count.shape, (3, 2, 4))
+        self.assertEqual(durations.shape, (3, 2, 4))
+
+    def test_array_same_as_single(self):
+        times = self.config.get_time_from_epoch("ALL")
+        mice = self.data.mice
+        antennas = ["1", "2", "5", "8", "9"]
+        count, durations = self.data.get_registration_stats_array(
+            mice, times[0], times[1], antennas, 1200)
+        for i, antenna in enumerate(antennas):
+            for j, mouse in enumerate(mice):
+                expected = self.data.get_registration_stats(
+                    mouse, times[0], times[1], antenna, 1200)
+                self.assertEqual((count[i, j].tolist(),
+                                  durations[i, j].tolist()), expected)
+
+    def test_array_unknown_antenna(self):
+        times = self.config.get_time_from_epoch("ALL")
+        count, durations = self.data.get_registration_stats_array(
+            ["mouse_1"], times[0], times[1], ["9"], 1800)
+        self.assertEqual(count.tolist(), [[[0, 0]]])
+
+    def test_array_empty_interval(self):
+        times = self.config.get_time_from_epoch("ALL")
+        count, durations = self.data.get_registration_stats_array(
+            ["mouse_1"], times[1], times[1], ["1"], 1800)
+        self.assertEqual(count.shape, (1, 1, 0))
+
+
+class TestWindow(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_short")
+        raw_data = uf.read_single_file(path, "20101010_110000.txt")
+        data = uf.from_raw_data(raw_data)
+        setup_config = SetupConfig()
+        cls.data = EcoHabDataBase(data, None, 2, setup_config)
+        cls.t_start = cls.data.session_start + 600
+        cls.t_end = cls.data.session_start + 1800
+
+    def test_registrations(self):
+        window = self.data.window(self.t_start, self.t_end)
+        self.data.mask_data(self.t_start, self.t_end)
+        expected = self.data.get_times(self.data.mice)
+        self.data.unmask_data()
+        self.assertEqual(window.get_times(self.data.mice), expected)
+
+    def test_visits(self):
+        window = self.data.window(self.t_start, self.t_end)
+        self.data.mask_data(self.t_start, self.t_end)
+        expected = self.data.get_starttimes(self.data.mice)
+        self.data.unmask_data()
+        self.assertEqual(window.get_starttimes(self.data.mice), expected)
+
+    def test_original_unmasked(self):
+        all_times = self.data.get_times(self.data.mice)
+        self.data.window(self.t_start, self.t_end)
+        self.assertIsNone(self.data.registrations.mask)
+        self.assertEqual(self.data.get_times(self.data.mice), all_times)
+
 
 if __name__ == '__main__':
     unittest.main()
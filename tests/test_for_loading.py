@@ -4,12 +4,15 @@
 from __future__ import print_function, division, absolute_import
 import os
 import glob
+import shutil
+import tempfile
 import unittest
 import numpy as np
 import pyEcoHAB.utils.for_loading as uf
 import pyEcoHAB.utility_functions as ut
-from pyEcoHAB import data_path
+from pyEcoHAB import data_path, sample_data
 from pyEcoHAB.SetupConfig import SetupConfig
+from pyEcoHAB.BaseFunctions import Data
 
 
 SAME_PIPE = {
@@ -98,6 +101,34 @@ class TestParseFilename(unittest.TestCase):
         self.assertRaises(ValueError, uf.parse_fname, fname=fname)
 
 
+class TestSelectFnames(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fnames = ["20101010_%02d0000.txt" % hour for hour in range(24)]
+        cls.t_0 = uf.fname_to_sec(cls.fnames[0])
+
+    def test_fname_to_sec(self):
+        self.assertEqual(uf.fname_to_sec(self.fnames[5]) - self.t_0,
+                         5*3600)
+
+    def test_no_mask(self):
+        self.assertEqual(uf.select_fnames(self.fnames, None), self.fnames)
+
+    def test_mask(self):
+        mask = (self.t_0 + 10*3600 + 100, self.t_0 + 11*3600 + 100)
+        out = uf.select_fnames(self.fnames, mask)
+        self.assertEqual(out, self.fnames[9:13])
+
+    def test_no_margin(self):
+        mask = (self.t_0 + 10*3600 + 100, self.t_0 + 11*3600 + 100)
+        out = uf.select_fnames(self.fnames, mask, margin=0)
+        self.assertEqual(out, self.fnames[10:12])
+
+    def test_unknown_format(self):
+        out = uf.select_fnames(["data_0000.txt"], (0, 1))
+        self.assertEqual(out, ["data_0000.txt"])
+
+
 class TestPrintHumanTime(unittest.TestCase):
     def test_date(self):
         tt = 1554247067
@@ -181,6 +212,133 @@ class TestReadInSingleFile(unittest.TestCase):
         self.assertEqual(last_line, self.out[-1])
 
 
+class TestTimesToSec(unittest.TestCase):
+    def test_sec(self):
+        out = uf.times_to_sec(["20190709", "20190709"],
+                              ["20:05:13.333", "20:05:13"])
+        self.assertEqual(out.tolist(), [1562702713.333, 1562702713.])
+
+    def test_same_as_time_to_sec(self):
+        dates = ["20190709", "20190710", "20190709"]
+        times = ["20:05:13.333", "00:00:01.001", "1:02:03.5"]
+        out = [uf.time_to_sec("%s %s" % (d, t)) for d, t in zip(dates,
+                                                                 times)]
+        self.assertEqual(uf.times_to_sec(dates, times).tolist(), out)
+
+    def test_sec_raise(self):
+        self.assertRaises(ValueError, uf.times_to_sec, ["20190709"],
+                          ["25:05:13"])
+
+
+class TestReadInSingleFileArray(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "weird_short_3_mice")
+        cls.out = uf.read_single_file_array(cls.path, "20101010_110000.txt")
+
+    def test_same_as_from_raw_data(self):
+        raw_data = uf.read_single_file(self.path, "20101010_110000.txt")
+        data = uf.from_raw_data(raw_data)
+        self.assertTrue(np.all(data == self.out))
+
+    def test_dtype(self):
+        self.assertEqual(self.out.dtype, np.dtype(uf.REGISTRATIONS_DTYPE))
+
+    def test_empty(self):
+        path = os.path.join(data_path, "empty")
+        out = uf.read_single_file_array(path, "20101010_110000.txt")
+        self.assertEqual(len(out), 0)
+
+    def test_legal_tags(self):
+        out = uf.read_single_file_array(self.path, "20101010_110000.txt",
+                                        legal_tags=["mouse_1", "mouse_3"])
+        expected = uf.remove_ghost_tags(self.out, ["mouse_1", "mouse_3"])
+        self.assertTrue(np.all(out == expected))
+
+    def test_legal_tag_string(self):
+        out = uf.read_single_file_array(self.path, "20101010_110000.txt",
+                                        legal_tags="mouse_2")
+        self.assertEqual(set(out["Tag"]), set(["mouse_2"]))
+
+    def test_remove_antennas(self):
+        out = uf.read_single_file_array(self.path, "20101010_110000.txt",
+                                        remove_antennas=["1", None])
+        expected = uf.remove_antennas(self.out, ["1"])
+        self.assertTrue(np.all(out == expected))
+
+    def test_nothing_left(self):
+        out = uf.read_single_file_array(self.path, "20101010_110000.txt",
+                                        legal_tags=["mouse_7"])
+        self.assertEqual(len(out), 0)
+        self.assertEqual(out.dtype, np.dtype(uf.REGISTRATIONS_DTYPE))
+
+
+class TestIterRegistrations(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.chunks = list(uf.iter_registrations(sample_data, chunk_hours=6))
+        fnames = sorted(uf.get_filenames(sample_data))
+        data = np.concatenate(uf.read_files(sample_data, fnames))
+        cls.all_data = data[np.argsort(data["Time"], kind="stable")]
+        cls.tmp = tempfile.mkdtemp()
+        lines = {"20101010_230000.txt": ["1\t23:59:58.000\t1\t100\tmouse_1",
+                                         "2\t00:00:01.000\t2\t100\tmouse_1"],
+                 "20101011_000000.txt": ["3\t00:00:02.000\t3\t100\tmouse_1"]}
+        for fname, rows in lines.items():
+            with open(os.path.join(cls.tmp, fname), "w") as f:
+                f.write("\n".join(rows) + "\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_same_as_all_data(self):
+        self.assertTrue(np.all(np.concatenate(self.chunks) == self.all_data))
+
+    def test_dtype(self):
+        for chunk in self.chunks:
+            self.assertEqual(chunk.dtype, np.dtype(uf.REGISTRATIONS_DTYPE))
+
+    def test_sorted(self):
+        for chunk in self.chunks:
+            self.assertTrue(np.all(np.diff(chunk["Time"]) >= 0))
+        for i in range(1, len(self.chunks)):
+            self.assertLessEqual(self.chunks[i - 1]["Time"][-1],
+                                 self.chunks[i]["Time"][0])
+
+    def test_chunk_length(self):
+        for chunk in self.chunks:
+            self.assertLess(chunk["Time"][-1] - chunk["Time"][0], 7*3600)
+
+    def test_midnight(self):
+        chunks = list(uf.iter_registrations(self.tmp, chunk_hours=1))
+        self.assertEqual([chunk["Id"].tolist() for chunk in chunks],
+                         [[1], [2, 3]])
+
+    def test_legal_tags(self):
+        chunks = list(uf.iter_registrations(self.tmp, legal_tags=["mouse_2"]))
+        self.assertEqual(chunks, [])
+
+    def test_saved_late(self):
+        tmp = tempfile.mkdtemp()
+        lines = {"20101010_100000.txt": ["1\t10:59:00.000\t1\t100\tmouse_1"],
+                 "20101010_110000.txt": ["2\t10:59:30.000\t2\t100\tmouse_1",
+                                         "3\t11:00:10.000\t3\t100\tmouse_1"],
+                 "20101010_120000.txt": ["4\t12:00:10.000\t4\t100\tmouse_1",
+                                         "5\t10:59:40.000\t5\t100\tmouse_1"]}
+        try:
+            for fname, rows in lines.items():
+                with open(os.path.join(tmp, fname), "w") as f:
+                    f.write("\n".join(rows) + "\n")
+            chunks = list(uf.iter_registrations(tmp, chunk_hours=1))
+        finally:
+            shutil.rmtree(tmp)
+        # 2 is moved to the previous chunk, 5 is saved two chunks late
+        # and goes to the earliest chunk that has not been yielded
+        self.assertEqual([chunk["Id"].tolist() for chunk in chunks],
+                         [[1, 2], [5, 3], [4]])
+
+
 class TestRemoveGhostTags(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -655,18 +813,90 @@ class TestAppendData(unittest.TestCase):
         self.assertTrue(np.all(line1 == line2))
 
 
+class TestMergeSorted(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(4)
+        cls.data_sets = []
+        for i in range(5):
+            data = np.zeros(50, dtype=uf.REGISTRATIONS_DTYPE)
+            data["Id"] = np.arange(50) + 100*i
+            data["Time"] = np.sort(np.random.randint(0, 40, 50))
+            data["Antenna"] = np.random.choice(["1", "2", "3"], 50)
+            data["Duration"] = np.random.randint(0, 3, 50)
+            data["Tag"] = np.random.choice(["mouse_1", "mouse_2"], 50)
+            cls.data_sets.append(data)
+        cls.data_sets[2] = cls.data_sets[2][::-1]
+
+    def test_same_as_stable_sort(self):
+        data = np.concatenate(self.data_sets)
+        expected = data[np.argsort(data["Time"], kind="stable")]
+        out = uf.merge_sorted(self.data_sets)
+        self.assertTrue(np.all(out == expected))
+
+    def test_single(self):
+        out = uf.merge_sorted(self.data_sets[2:3])
+        self.assertTrue(uf.is_sorted(out["Time"]))
+
+    def test_empty(self):
+        self.assertEqual(len(uf.merge_sorted([])), 0)
+
+    def test_append_data_sources(self):
+        expected = np.concatenate(self.data_sets)
+        expected.sort(order="Time")
+        out = uf.append_data_sources(self.data_sets)
+        self.assertTrue(np.all(out == expected))
+
+
+class TestRegistrationStatistics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        data = [(1, 1., "1", 2000, "mouse_1"),
+                (2, 1.5, "3", 100, "mouse_2"),
+                (3, 2., "2", 100, "mouse_1"),
+                (4, 4., "1", 100, "mouse_1"),
+                (5, 5., "4", 100, "mouse_2")]
+        cls.data = np.array(data, dtype=uf.REGISTRATIONS_DTYPE)
+        cls.stats = uf.registration_statistics(cls.data)
+
+    def test_antennas(self):
+        self.assertEqual(self.stats["antennas"], ["1", "2", "3", "4"])
+
+    def test_pairs(self):
+        self.assertEqual(self.stats["pairs"].tolist(),
+                         [[0, 1, 0, 0], [1, 0, 0, 0],
+                          [0, 0, 0, 1], [0, 0, 0, 0]])
+
+    def test_fast_pairs(self):
+        self.assertEqual(self.stats["fast_pairs"].tolist(),
+                         [[0, 1, 0, 0], [0, 0, 0, 0],
+                          [0, 0, 0, 0], [0, 0, 0, 0]])
+
+    def test_empty(self):
+        self.assertRaises(Exception, uf.registration_statistics,
+                          self.data[:0])
+
+    def test_codes(self):
+        stats = uf.registration_statistics(Data(self.data, None))
+        self.assertEqual(stats["antennas"], self.stats["antennas"])
+        self.assertEqual(stats["codes"].tolist(),
+                         self.stats["codes"].tolist())
+        self.assertEqual(stats["pairs"].tolist(),
+                         self.stats["pairs"].tolist())
+        self.assertEqual(stats["fast_pairs"].tolist(),
+                         self.stats["fast_pairs"].tolist())
+
+    def test_incorrect_tunnel_registrations(self):
+        config = SetupConfig()
+        count, total = uf.incorrect_tunnel_registrations(self.data, config)
+        self.assertEqual(dict(count), {"1 2": 1, "3 4": 0, "5 6": 0,
+                                       "7 8": 0})
+        self.assertEqual(total, {"1 2": 2, "3 4": 1, "5 6": 0, "7 8": 0})
+
+
 class TestTunnelErrors(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        antennas = ["1", "2", "1", "2", "3", "4", "5", "6", "7"]
-        times = [1,   2,  2.5,   3,  4.5, 5.5, 6.5, 7.5, 10.5]
-        durations = [3, 600,  3,    34,  55,  66, 1999, 200, 100]
-        cls.pred_out = {"1 2": 1, "3 4": 0, "5 6": 1, "7 8": 0}
-        keys = cls.pred_out.keys()
-        cls.out, cls.tot = uf.incorrect_tunnel_single_mouse(keys,
-                                                            antennas,
-                                                            times, durations)
-        cls.pred_tot = {"1 2": 3, "3 4": 1, "5 6": 1, "7 8": 0}
         path = os.path.join(data_path, "weird_very_short_3_mice")
         cls.raw_data = uf.read_single_file(path, "20101010_110000.txt")
         cls.data = uf.from_raw_data(cls.raw_data)
@@ -676,12 +906,6 @@ class TestTunnelErrors(unittest.TestCase):
         cls.pred_out_i = {"1 2": 0, "3 4": 0, "5 6": 2, "7 8": 0}
         cls.pred_tot_i = {"1 2": 2, "3 4": 1, "5 6": 7, "7 8": 0}
 
-    def test_incorrect(self):
-        self.assertEqual(self.pred_out, self.out)
-
-    def test_total(self):
-        self.assertEqual(self.pred_tot, self.tot)
-
     def test_data_incorrect(self):
         self.assertEqual(self.pred_out_i, self.out_i)
 
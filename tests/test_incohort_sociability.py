@@ -383,6 +383,36 @@ class TestMouseAlone(unittest.TestCase):
         self.assertEqual(self.out4["mouse3"], 2)
 
 
+class TestGetOccupancy(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        data = {
+            "mouse1": [["cage A", 0., 10.], ["cage B", 11., 12.]],
+            "mouse2": [["cage A", 1., 2.], ["cage A", 3., 4.]],
+            "mouse3": [["cage A", 3.5, 12.]],
+        }
+        cls.out = ics.get_occupancy(data, ["mouse1", "mouse2", "mouse3"],
+                                    "cage A")
+
+    def test_times(self):
+        self.assertEqual(self.out[0].tolist(),
+                         [0., 1., 2., 3., 3.5, 4., 10., 12.])
+
+    def test_counts(self):
+        self.assertEqual(self.out[1].tolist(), [1, 2, 1, 2, 3, 2, 1])
+
+    def test_owners(self):
+        self.assertEqual(self.out[2].tolist(), [0, -1, 0, -1, -1, -1, 2])
+
+    def test_mouse_alone(self):
+        data = {
+            "mouse1": [["cage A", 0., 10.]],
+            "mouse2": [["cage A", 1., 2.], ["cage A", 3., 4.]],
+        }
+        out = ics.mouse_alone(data, "cage A")
+        self.assertEqual(out, {"mouse1": 8., "mouse2": 0})
+
+
 class TestMiceOverlap(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -460,6 +490,130 @@ class TestMiceOverlap(unittest.TestCase):
         self.assertEqual(out1, 5)
 
 
+class TestMiceOverlapMatrix(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        mouse1 = [["cage B", 2, 3],
+                  ["cage A", 5, 6],
+                  ["cage D", 8, 9],
+                  ["cage C", 10, 12],
+                  ["cage B", 14, 20],
+                  ["cage C", 21, 28],
+                  ["cage D", 31, 35],
+                  ["cage A", 40, 45],
+                  ]
+        mouse2 = [["cage B", 0, 3],
+                  ["cage C", 5, 6],
+                  ["cage D", 8, 9],
+                  ["cage A", 10, 12],
+                  ["cage B", 13, 18],
+                  ["cage A", 22, 50],
+                  ]
+        mouse3 = [["cage B", 2, 3.1],
+                  ["cage A", 5, 6],
+                  ["cage D", 7, 10],
+                  ["cage C", 11, 15],
+                  ["cage B", 16, 25],
+                  ["cage C", 27, 35],
+                  ["cage D", 38, 45],
+                  ["cage A", 50, 52],
+                  ]
+        cls.data = {
+            'mouse1': mouse1,
+            'mouse2': mouse2,
+            'mouse3': mouse3,
+            'mouse4': [],
+            }
+        cls.mice = ["mouse1", "mouse2", "mouse3", "mouse4"]
+
+    def test_same_as_mice_overlap(self):
+        for address in ["cage A", "cage B", "cage C", "cage D"]:
+            out = ics.mice_overlap_matrix(self.data, self.mice, address)
+            for i, m1 in enumerate(self.mice):
+                for j, m2 in enumerate(self.mice):
+                    if i == j:
+                        self.assertEqual(out[i, j], 0)
+                        continue
+                    ints1 = utils.get_intervals(self.data[m1], address)
+                    ints2 = utils.get_intervals(self.data[m2], address)
+                    self.assertEqual(out[i, j],
+                                     ics.mice_overlap(ints1, ints2))
+
+    def test_cage_B(self):
+        out = ics.mice_overlap_matrix(self.data, self.mice, "cage B")
+        self.assertEqual(out[0].tolist(), [0, 5, 5, 0])
+
+    def test_empty(self):
+        out = ics.mice_overlap_matrix(self.data, self.mice, "cage E")
+        self.assertEqual(out.tolist(), np.zeros((4, 4)).tolist())
+
+    def test_same_mouse_ignored(self):
+        data = {"mouse1": [["cage A", 1, 5], ["cage A", 2, 4]],
+                "mouse2": [["cage A", 3, 6]]}
+        out = ics.mice_overlap_matrix(data, ["mouse1", "mouse2"], "cage A")
+        self.assertEqual(out.tolist(), [[0, 3], [3, 0]])
+
+
+class TestGetColocation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_short_3_mice")
+        cls.data = Loader(path)
+        config = Timeline(path)
+        cls.intervals = [config.get_time_from_epoch(phase)
+                         for phase in ["1 dark", "1 light"]]
+        cls.out = ics.get_colocation(cls.data, cls.data.mice, cls.intervals)
+
+    def test_shape(self):
+        self.assertEqual(self.out[0].shape,
+                         (2, len(self.data.cages), 3, 3))
+        self.assertEqual(self.out[1].shape, (2, len(self.data.cages), 3))
+        self.assertEqual(self.out[2].shape, (2, len(self.data.cages), 3))
+
+    def test_values(self):
+        mice = self.data.mice
+        for i, interval in enumerate(self.intervals):
+            data = utils.prepare_data(self.data, mice, interval)
+            for j, address in enumerate(self.data.cages):
+                overlaps = ics.mice_overlap_matrix(data, mice, address)
+                self.assertEqual(self.out[0][i, j].tolist(),
+                                 overlaps.tolist())
+                alone = ics.mouse_alone(data, address)
+                for k, mouse in enumerate(mice):
+                    ints = utils.get_intervals(data[mouse], address)
+                    self.assertEqual(self.out[1][i, j, k],
+                                     utils.calculate_total_duration(ints))
+                    self.assertEqual(self.out[2][i, j, k], alone[mouse])
+
+    def test_cached(self):
+        n_cached = len(self.data._colocation_cache)
+        out = ics.get_colocation(self.data, self.data.mice,
+                                 self.intervals[::-1])
+        self.assertEqual(len(self.data._colocation_cache), n_cached)
+        self.assertEqual(out[0][0].tolist(), self.out[0][1].tolist())
+
+    def test_window_not_shared(self):
+        view = self.data.window(*self.intervals[0])
+        self.assertIsNot(view._colocation_cache,
+                         self.data._colocation_cache)
+        self.assertEqual(view._colocation_cache, {})
+
+    def test_one_occupancy_per_cage(self):
+        calls = []
+        get_occupancy = ics.get_occupancy
+
+        def counted(*args):
+            calls.append(args[2])
+            return get_occupancy(*args)
+        ics.get_occupancy = counted
+        try:
+            ics.get_colocation(self.data.window(0, 1), self.data.mice,
+                               self.intervals[:1])
+        finally:
+            ics.get_occupancy = get_occupancy
+        self.assertEqual(sorted(calls), sorted(self.data.cages))
+
+
 class TestTimeTogether(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -1,6 +1,9 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
 import os
+import copy
+import shutil
+import tempfile
 import unittest
 from datetime import date
 import numpy as np
@@ -29,6 +32,8 @@ class TestLoader(unittest.TestCase):
         cls.dataset3 = Loader(cls.path1, visit_threshold=1.5,
                               setup_config=cls.setup3, remove_antennas=["8"])
         cls.path_empty = os.path.join(data_path, "empty")
+        cls.dataset1_parallel = Loader(cls.path1, visit_threshold=1.5,
+                                       n_jobs=2)
 
     def test_load_empty(self):
         self.assertRaises(Exception, Loader, self.path_empty)
@@ -45,6 +50,20 @@ class TestLoader(unittest.TestCase):
     def test_prefix_2(self):
         self.assertEqual(self.dataset1.prefix, "gugu")
 
+    def test_parallel_registrations(self):
+        self.assertTrue(np.all(self.dataset1.registrations.data ==
+                               self.dataset1_parallel.registrations.data))
+
+    def test_parallel_visits(self):
+        self.assertTrue(np.all(self.dataset1.visits.data ==
+                               self.dataset1_parallel.visits.data))
+
+    def test_visits_same_as_loop(self):
+        for data in [self.dataset1, self.dataset2, self.dataset3]:
+            temp = data._calculate_animal_positions(data.setup_config)
+            self.assertTrue(np.all(uf.transform_visits(temp) ==
+                                   data.visits.data))
+
     def test_visits_1(self):
         out = self.dataset2.get_visits()
         out2 = self.dataset2.visits.data
@@ -114,6 +133,332 @@ class TestLoader(unittest.TestCase):
         self.assertEqual(len(out)-1, len(out2))
 
 
+class TestLoaderDiagnostics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(data_path, "weird_short_3_mice")
+        cls.now = Loader(cls.path, res_dir=os.path.join(cls.tmp, "now"),
+                         add_date=False)
+        cls.background = Loader(cls.path,
+                                res_dir=os.path.join(cls.tmp, "background"),
+                                add_date=False, diagnostics="background")
+        cls.lazy_dir = os.path.join(cls.tmp, "lazy")
+        cls.lazy = Loader(cls.path, res_dir=cls.lazy_dir, add_date=False,
+                          diagnostics="lazy")
+        cls.lazy_saved = os.path.exists(os.path.join(cls.lazy_dir,
+                                                     "diagnostics"))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_now(self):
+        self.assertEqual(len(self.now.diagnostics), 5)
+        self.assertIsNone(self.now.diagnostics_future)
+
+    def test_background(self):
+        self.assertEqual(self.background.diagnostics, self.now.diagnostics)
+
+    def test_background_thread_finished(self):
+        self.background.diagnostics
+        thread = self.background._diagnostics_thread
+        if thread is not None:
+            thread.join()
+        self.assertIsNone(self.background._diagnostics_thread)
+
+    def test_background_exception(self):
+        def fail():
+            raise ValueError("broken")
+        data = copy.copy(self.now)
+        data._start_diagnostics("background", fail)
+        self.assertRaises(ValueError, lambda: data.diagnostics)
+        self.assertRaises(ValueError, lambda: data.diagnostics)
+
+    def test_background_order(self):
+        data = copy.copy(self.now)
+        out = []
+        data._start_diagnostics("background", out.append, 1)
+        data._start_diagnostics("background", out.append, 2)
+        data.diagnostics
+        self.assertEqual(out, [1, 2])
+
+    def test_lazy_not_saved(self):
+        self.assertFalse(self.lazy_saved)
+
+    def test_lazy(self):
+        self.assertEqual(self.lazy.diagnostics, self.now.diagnostics)
+        self.assertTrue(os.path.exists(os.path.join(self.lazy_dir,
+                                                    "diagnostics")))
+
+    def test_visits(self):
+        self.assertTrue(np.all(self.lazy.visits.data ==
+                               self.now.visits.data))
+
+    def test_unknown_mode(self):
+        self.assertRaises(Exception, Loader, self.path,
+                          res_dir=os.path.join(self.tmp, "unknown"),
+                          diagnostics="later")
+
+
+class TestLoaderCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp, "data")
+        shutil.copytree(os.path.join(data_path, "weird_very_short"),
+                        cls.path)
+        cls.cache_dir = os.path.join(cls.tmp, "cache")
+        cls.original = Loader(cls.path, visit_threshold=2)
+        cls.first = Loader(cls.path, visit_threshold=2, cache=True,
+                           cache_dir=cls.cache_dir)
+        cls.cached = Loader(cls.path, visit_threshold=2, cache=True,
+                            cache_dir=cls.cache_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_cache_file(self):
+        fname = uf.cache_fname(self.cache_dir, self.path)
+        self.assertTrue(os.path.isfile(fname))
+
+    def test_registrations(self):
+        self.assertTrue(np.all(self.original.registrations.data ==
+                               self.cached.registrations.data))
+
+    def test_visits(self):
+        self.assertTrue(np.all(self.original.visits.data ==
+                               self.cached.visits.data))
+
+    def test_mice(self):
+        self.assertEqual(self.original.mice, self.cached.mice)
+
+    def test_mask(self):
+        times = sorted(self.original.get_times(self.original.mice))
+        mask = (times[5], times[-5])
+        cache_dir = os.path.join(self.tmp, "cache_mask")
+        original = Loader(self.path, visit_threshold=2, mask=mask)
+        Loader(self.path, visit_threshold=2, mask=mask, cache=True,
+               cache_dir=cache_dir)
+        cached = Loader(self.path, visit_threshold=2, mask=mask, cache=True,
+                        cache_dir=cache_dir)
+        self.assertEqual(cached.registrations.data.tolist(),
+                         original.registrations.data.tolist())
+        self.assertEqual(cached.visits.data.tolist(),
+                         original.visits.data.tolist())
+
+    def test_diagnostics(self):
+        diag_path = os.path.join(self.cached.res_dir, "diagnostics")
+        for fname in uf.DIAGNOSTICS_FNAMES:
+            self.assertTrue(os.path.isfile(os.path.join(diag_path, fname)))
+
+    def test_load_cache(self):
+        fname = uf.cache_fname(self.cache_dir, self.path)
+        self.assertIsNone(uf.load_cache(fname, "not a key"))
+
+    def test_load_diagnostics_cache(self):
+        fname = uf.cache_fname(self.cache_dir, self.path)
+        self.assertIsNone(uf.load_diagnostics_cache(fname, "not a key"))
+
+    def test_diagnostics_cache_file(self):
+        fname = uf.cache_fname(self.cache_dir, self.path)
+        self.assertTrue(os.path.isfile(uf.diagnostics_cache_fname(fname)))
+
+    def test_lazy_saves_cache(self):
+        cache_dir = os.path.join(self.tmp, "cache_lazy")
+        data = Loader(self.path, visit_threshold=2, cache=True,
+                      cache_dir=cache_dir, diagnostics="lazy")
+        fname = uf.cache_fname(cache_dir, self.path)
+        self.assertTrue(os.path.isfile(fname))
+        self.assertFalse(os.path.isfile(uf.diagnostics_cache_fname(fname)))
+        self.assertEqual(data.diagnostics, self.original.diagnostics)
+        self.assertTrue(os.path.isfile(uf.diagnostics_cache_fname(fname)))
+
+    def test_lazy_pending_codes(self):
+        data = Loader(self.path, visit_threshold=2, diagnostics="lazy")
+        function, args = data._pending_diagnostics
+        registrations = args[0]
+        self.assertIs(registrations, data.registrations)
+        self.assertIn(registrations._data["Tag"].dtype.kind, "iu")
+
+    def test_load_missing_cache(self):
+        fname = os.path.join(self.tmp, "missing.npz")
+        self.assertIsNone(uf.load_cache(fname, "key"))
+
+    def test_key_threshold(self):
+        fnames = uf.get_filenames(self.path)
+        key1 = uf.cache_key(self.path, fnames, self.original.setup_config,
+                            visit_threshold=2)
+        key2 = uf.cache_key(self.path, fnames, self.original.setup_config,
+                            visit_threshold=3)
+        self.assertNotEqual(key1, key2)
+
+    def test_key_modified_file(self):
+        fnames = uf.get_filenames(self.path)
+        key1 = uf.cache_key(self.path, fnames, self.original.setup_config)
+        fname = os.path.join(self.path, fnames[0])
+        stat = os.stat(fname)
+        os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        key2 = uf.cache_key(self.path, fnames, self.original.setup_config)
+        os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertNotEqual(key1, key2)
+
+    def test_file_modified_while_loading(self):
+        path = os.path.join(self.tmp, "modified")
+        shutil.copytree(self.path, path)
+        cache_dir = os.path.join(self.tmp, "cache_modified")
+        fname = os.path.join(path, "20101010_110000.txt")
+        read_files = uf.read_files
+
+        def read_and_append(*args, **kwargs):
+            out = read_files(*args, **kwargs)
+            with open(fname, "a") as f:
+                f.write("15124\t2010.10.10\t11:09:45.000\t1\t256"
+                        "\tmouse_1\r\n")
+            return out
+        uf.read_files = read_and_append
+        try:
+            first = Loader(path, visit_threshold=2, cache=True,
+                           cache_dir=cache_dir)
+        finally:
+            uf.read_files = read_files
+        second = Loader(path, visit_threshold=2, cache=True,
+                        cache_dir=cache_dir)
+        self.assertEqual(len(second.registrations),
+                         len(first.registrations) + 1)
+
+    def test_different_threshold(self):
+        data = Loader(self.path, visit_threshold=3, cache=True,
+                      cache_dir=self.cache_dir)
+        data_no_cache = Loader(self.path, visit_threshold=3)
+        self.assertEqual(data.threshold, 3)
+        self.assertTrue(np.all(data.visits.data ==
+                               data_no_cache.visits.data))
+
+
+class TestLoaderRefresh(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp, "data")
+        os.mkdir(cls.path)
+        source = os.path.join(data_path, "BALB_VPA_data_cohort_1")
+        fnames = sorted(uf.get_filenames(source))[:6]
+        shutil.copy(os.path.join(source, "config.txt"), cls.path)
+        for fname in fnames[:2]:
+            shutil.copy(os.path.join(source, fname), cls.path)
+        # the last file is still being recorded
+        with open(os.path.join(source, fnames[2]), "rb") as f:
+            lines = f.readlines()
+        with open(os.path.join(cls.path, fnames[2]), "wb") as f:
+            f.writelines(lines[:len(lines)//2])
+        cls.data = Loader(cls.path)
+        cache_dir = os.path.join(cls.tmp, "cache")
+        Loader(cls.path, cache=True, cache_dir=cache_dir)
+        cls.cached = Loader(cls.path, cache=True, cache_dir=cache_dir)
+        cls.first_refresh = cls.data.refresh()
+        with open(os.path.join(cls.path, fnames[2]), "ab") as f:
+            f.writelines(lines[len(lines)//2:])
+        cls.appended_fnames = cls.data.refresh()
+        cls.cached.refresh()
+        for fname in fnames[3:]:
+            shutil.copy(os.path.join(source, fname), cls.path)
+        cls.new_fnames = cls.data.refresh()
+        cls.cached.refresh()
+        cls.from_cache = Loader(cls.path, cache=True, cache_dir=cache_dir)
+        cls.reference = Loader(cls.path)
+        cls.expected_fnames = fnames[3:]
+        cls.appended_fname = fnames[2]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_no_new_files(self):
+        self.assertEqual(self.first_refresh, [])
+
+    def test_new_files(self):
+        self.assertEqual(self.new_fnames, self.expected_fnames)
+
+    def test_appended_file(self):
+        self.assertEqual(self.appended_fnames, [self.appended_fname])
+
+    def test_appended_registrations(self):
+        self.assertEqual(len(self.data.registrations),
+                         len(self.reference.registrations))
+
+    def test_cached_registrations(self):
+        self.assertTrue(np.all(self.cached.registrations.data ==
+                               self.reference.registrations.data))
+
+    def test_cached_visits(self):
+        self.assertTrue(np.all(self.cached.visits.data ==
+                               self.reference.visits.data))
+
+    def test_from_cache(self):
+        self.assertTrue(np.all(self.from_cache.registrations.data ==
+                               self.reference.registrations.data))
+
+    def test_fnames(self):
+        self.assertEqual(sorted(self.data._fnames),
+                         sorted(self.reference._fnames))
+
+    def test_registrations(self):
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.reference.registrations.data))
+
+    def test_visits(self):
+        self.assertTrue(np.all(self.data.visits.data ==
+                               self.reference.visits.data))
+
+    def test_mice(self):
+        self.assertEqual(self.data.mice, self.reference.mice)
+
+    def test_session_end(self):
+        self.assertEqual(self.data.session_end, self.reference.session_end)
+
+
+class TestLoaderMask(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp, "data")
+        os.mkdir(cls.path)
+        source = os.path.join(data_path, "BALB_VPA_data_cohort_1")
+        fnames = sorted(uf.get_filenames(source))[:8]
+        shutil.copy(os.path.join(source, "config.txt"), cls.path)
+        for fname in fnames:
+            shutil.copy(os.path.join(source, fname), cls.path)
+        cls.mask = (uf.fname_to_sec(fnames[3]) + 600,
+                    uf.fname_to_sec(fnames[4]) + 1200)
+        cls.full = Loader(cls.path)
+        cls.data = Loader(cls.path, mask=cls.mask)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_registrations(self):
+        full = self.full.registrations.data
+        expected = full[(full["Time"] >= self.mask[0]) &
+                        (full["Time"] < self.mask[1])]
+        self.assertTrue(np.all(self.data.registrations.data == expected))
+
+    def test_session_bounds(self):
+        self.assertGreaterEqual(self.data.session_start, self.mask[0])
+        self.assertLess(self.data.session_end, self.mask[1])
+
+    def test_mice(self):
+        mice = set(self.data.registrations.data["Tag"].tolist())
+        self.assertEqual(sorted(self.data.mice), sorted(mice))
+
+    def test_visits_in_mask(self):
+        starts = self.data.visits.data["AbsStartTimecode"]
+        self.assertTrue(np.all(starts >= self.mask[0]))
+        self.assertTrue(np.all(starts < self.mask[1]))
+
+
 class TestMerger(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -125,8 +470,14 @@ class TestMerger(unittest.TestCase):
         cls.res_dir = os.path.join(path, "results")
         config = os.path.join(path, "experiment_setup.txt")
         cls.data = Merger(config, cls.res_dir, cls.data1, cls.data2)
+        cls.data_parallel = Merger(config, cls.res_dir, cls.data1,
+                                   cls.data2, n_jobs=2)
         cls.original_data = Loader(sample_data)
 
+    def test_parallel_visits(self):
+        self.assertTrue(np.all(self.data.visits.data ==
+                               self.data_parallel.visits.data))
+
     def test_1(self):
         self.assertEqual(self.data.res_dir,
                          "%s_%s" % (self.res_dir,
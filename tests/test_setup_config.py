@@ -2,7 +2,12 @@
 from __future__ import print_function, division, absolute_import
 import os
 import unittest
+import numpy as np
 from pyEcoHAB import SetupConfig, ExperimentSetupConfig
+from pyEcoHAB.SetupConfig import SAME_ANTENNA, SAME_TUNNEL
+from pyEcoHAB.SetupConfig import SAME_ADDRESS as SAME_ADDRESS_TRANSITION
+from pyEcoHAB.SetupConfig import OPPOSITE_TUNNEL, TRANSITION_UNDEFINED
+from pyEcoHAB.SetupConfig import SURROUNDING as SURROUNDING_TRANSITION
 from pyEcoHAB import data_path
 
 # In the first scripts for EcoHAB data analysis,
@@ -1501,5 +1506,91 @@ class TestExperimentSetupConfig(unittest.TestCase):
         self.assertEqual(calculated, expected)
 
 
+class TestSetupTopology(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.default = SetupConfig()
+        cls.topology = cls.default.topology
+        path = os.path.join(data_path, "test_setups")
+        cls.custom = SetupConfig(path=path, fname="setup_internal.txt")
+
+    def transition(self, a1, a2):
+        codes = self.topology.encode([a1, a2])
+        return self.topology.transitions[codes[0], codes[1]]
+
+    def address(self, a1, a2):
+        codes = self.topology.encode([a1, a2])
+        idx = self.topology.transition_address[codes[0], codes[1]]
+        if idx < 0:
+            return None
+        return self.topology.addresses[idx]
+
+    def test_cached(self):
+        self.assertIs(self.default.topology, self.topology)
+
+    def test_antennas(self):
+        self.assertEqual(self.topology.antennas,
+                         ("1", "2", "3", "4", "5", "6", "7", "8"))
+
+    def test_encode_decode(self):
+        codes = self.topology.encode(["8", "1", "9", "8"])
+        self.assertEqual(codes.tolist(), [7, 0, 8, 7])
+        self.assertEqual([self.topology.decode(c) for c in codes],
+                         ["8", "1", None, "8"])
+
+    def test_cage(self):
+        cages = [self.topology.cages[c] for c in self.topology.cage[:-1]]
+        self.assertEqual(cages, [ADDRESS[a] for a in self.topology.antennas])
+
+    def test_tunnel(self):
+        tunnel = self.topology.tunnel
+        self.assertEqual(tunnel[0], tunnel[1])
+        self.assertEqual(tunnel[2], tunnel[3])
+        self.assertNotEqual(tunnel[1], tunnel[2])
+        self.assertEqual(tunnel[-1], -1)
+
+    def test_other_tunnel_antennas(self):
+        self.assertEqual(self.topology.other_tunnel_antennas["3"], ("4",))
+
+    def test_same_antenna(self):
+        self.assertEqual(self.transition("1", "1"), SAME_ANTENNA)
+        self.assertEqual(self.address("1", "1"), "cage A")
+
+    def test_same_tunnel(self):
+        self.assertEqual(self.transition("1", "2"), SAME_TUNNEL)
+        self.assertIsNone(self.address("1", "2"))
+
+    def test_same_address(self):
+        self.assertEqual(self.transition("2", "3"),
+                         SAME_ADDRESS_TRANSITION)
+        self.assertEqual(self.address("2", "3"), "cage B")
+
+    def test_surrounding(self):
+        self.assertEqual(self.transition("1", "3"),
+                         SURROUNDING_TRANSITION)
+        self.assertEqual(self.address("1", "3"), "cage B")
+
+    def test_opposite_tunnel(self):
+        self.assertEqual(self.transition("1", "5"),
+                         OPPOSITE_TUNNEL)
+
+    def test_unknown_antenna(self):
+        self.assertEqual(self.transition("9", "1"),
+                         TRANSITION_UNDEFINED)
+
+    def test_internal(self):
+        topology = self.custom.topology
+        internal = [topology.antennas[i]
+                    for i in np.where(topology.internal)[0]]
+        self.assertEqual(sorted(internal),
+                         sorted(self.custom.internal_antennas))
+
+    def test_read_only(self):
+        self.assertRaises(AttributeError, setattr, self.topology, "cage",
+                          None)
+        self.assertRaises(ValueError, self.topology.transitions.__setitem__,
+                          (0, 0), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -106,6 +106,35 @@ class TestFilter(unittest.TestCase):
                                "Light 3", "LIGHT 2", "light 1"])
 
 
+class TestGetTimesAntennas(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_very_short")
+        cls.data = Loader(path)
+        cls.mouse = cls.data.mice[0]
+        cls.times = cls.data.get_times(cls.mouse)
+        cls.start, cls.end = cls.times[1], cls.times[-2]
+
+    def tearDown(self):
+        self.data.unmask_data()
+
+    def test_whole_keeps_mask(self):
+        self.data.mask_data(self.start, self.end)
+        masked = self.data.get_times(self.mouse)
+        times, antennas = uf.get_times_antennas(self.data, self.mouse, 0, -1)
+        self.assertEqual(times, self.times)
+        self.assertEqual(self.data.mask, (self.start, self.end))
+        self.assertEqual(self.data.get_times(self.mouse), masked)
+
+    def test_whole_arrays_keep_mask(self):
+        self.data.mask_data(self.start, self.end)
+        masked = self.data.get_times(self.mouse)
+        times, antennas = uf.get_times_antennas_arrays(self.data,
+                                                       self.mouse, 0, -1)
+        self.assertEqual(times.tolist(), self.times)
+        self.assertEqual(self.data.get_times(self.mouse), masked)
+
+
 class TestGetMoreStates(unittest.TestCase):
     def test_2nd_tier_len_states(self):
         antennas = [5, 6, 6, 5, 5, 6, 7, 6, 5, 5, 6, 6, 6, 7]
@@ -1453,6 +1482,14 @@ class TestGetEHSData(unittest.TestCase):
                       1286708858.91]
         self.assertEqual(out, starttimes)
 
+    def test_get_ecohab_data_arrays(self):
+        out = uf.get_ecohab_data_with_margin_arrays(self.data, "mouse_1",
+                                                    self.t1, self.t2,
+                                                    margin=100)
+        self.assertEqual(out[0].tolist(), self.m_1_a)
+        self.assertEqual(out[1].tolist(), self.s1)
+        self.assertEqual(out[2].tolist(), self.e1)
+
     def test_get_ecohab_data_endtimes(self):
         out = sorted(self.e1)
         endtimes = [1286708669.65, 1286708674.28, 1286708680.125,
@@ -1725,6 +1762,177 @@ class TestGetAnimalPositions(unittest.TestCase):
         self.assertEqual(o1, o2)
 
 
+class TestGetAnimalPositionArray(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.configs = [SetupConfig(),
+                       SetupConfig(os.path.join(data_path, "modular_1",
+                                                "data_setup_additional"))]
+
+    def compare(self, config, times, antennas, threshold):
+        out = uf.get_animal_position_array(times, antennas, "mouse_1",
+                                           threshold, config.topology)
+        expected = uf.get_animal_position(times, antennas, "mouse_1",
+                                          threshold, config.same_tunnel,
+                                          config.same_address,
+                                          config.opposite_tunnel,
+                                          config.address,
+                                          config.address_surrounding,
+                                          config.address_non_adjacent,
+                                          config.internal_antennas)
+        self.assertEqual([tuple(visit) for visit in out.tolist()],
+                         expected)
+
+    def test_empty(self):
+        out = uf.get_animal_position_array([], [], "mouse_1", 2,
+                                           self.configs[0].topology)
+        self.assertEqual(len(out), 0)
+
+    def test_chamber(self):
+        out = uf.get_animal_position_array([2, 6], ["1", "8"], "mouse_1",
+                                           2, self.configs[0].topology)
+        self.assertEqual(out.tolist(),
+                         [("cage A", "mouse_1", 2, 6, 4, True)])
+
+    def test_internal_antennas(self):
+        times = [1., 2., 5., 6., 9., 10., 15., 16.]
+        antennas = ["1", "8", "8", "2", "8", "2", "1", "1"]
+        self.compare(self.configs[1], times, antennas, 2)
+
+    def test_internal_antenna_at_the_end(self):
+        times = [1., 2., 5., 6., 9.]
+        antennas = ["1", "2", "8", "8", "8"]
+        self.compare(self.configs[1], times, antennas, 2)
+
+    def test_random(self):
+        random.seed(2)
+        for config in self.configs:
+            antennas = sorted(config.all_antennas)
+            for i in range(300):
+                length = random.randint(0, 15)
+                ants = [random.choice(antennas) for j in range(length)]
+                times = sorted([random.uniform(0, 50)
+                                for j in range(length)])
+                self.compare(config, times, ants, random.choice([0, 2, 5]))
+
+    def test_missing_antenna(self):
+        self.assertRaises(KeyError, uf.get_animal_position_array,
+                          [1, 5, 9], ["1", "9", "1"], "mouse_1", 2,
+                          self.configs[0].topology)
+
+
+class TestPositionStream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.configs = [SetupConfig(),
+                       SetupConfig(os.path.join(data_path, "modular_1",
+                                                "data_setup_additional"))]
+        cls.dtype = [("Id", int), ("Time", float), ("Antenna", "U15"),
+                     ("Duration", int), ("Tag", "U15")]
+
+    def registrations(self, config, length):
+        antennas = sorted(config.all_antennas)
+        times = sorted([random.uniform(0, 100) for j in range(length)])
+        return np.array([(j, t, random.choice(antennas), 100,
+                          random.choice(["mouse_1", "mouse_2"]))
+                         for j, t in enumerate(times)], dtype=self.dtype)
+
+    def stream(self, config, data, splits, threshold=2):
+        stream = uf.PositionStream(config, threshold)
+        bounds = [0] + sorted(splits) + [len(data)]
+        out = [stream.update(data[bounds[i]:bounds[i + 1]])
+               for i in range(len(bounds) - 1)]
+        return np.concatenate(out + [stream.flush()])
+
+    def test_empty(self):
+        out = self.stream(self.configs[0], np.array([], dtype=self.dtype),
+                          [])
+        self.assertEqual(len(out), 0)
+
+    def test_pending(self):
+        stream = uf.PositionStream(self.configs[0])
+        data = np.array([(1, 1., "1", 100, "mouse_1"),
+                         (2, 5., "1", 100, "mouse_1")], dtype=self.dtype)
+        self.assertEqual(stream.update(data).tolist(),
+                         [("cage A", "mouse_1", 1., 5., 4., True)])
+        self.assertEqual(len(stream.flush()), 0)
+
+    def test_random(self):
+        random.seed(5)
+        for config in self.configs:
+            for i in range(100):
+                data = self.registrations(config, random.randint(0, 30))
+                splits = [random.randint(0, len(data))
+                          for j in range(random.randint(0, 4))]
+                threshold = random.choice([0, 2, 5])
+                out = self.stream(config, data, splits, threshold)
+                for mouse in ["mouse_1", "mouse_2"]:
+                    mine = data[data["Tag"] == mouse]
+                    expected = uf.get_animal_position_array(
+                        mine["Time"], mine["Antenna"], mouse, threshold,
+                        config.topology)
+                    self.assertEqual(out[out["Tag"] == mouse].tolist(),
+                                     expected.tolist())
+
+
+class TestGetPositionResumeIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.config = SetupConfig(os.path.join(data_path, "modular_1",
+                                              "data_setup_additional"))
+
+    def positions(self, times, antennas):
+        config = self.config
+        return uf.get_animal_position(times, antennas, "mouse_1", 2,
+                                      config.same_tunnel,
+                                      config.same_address,
+                                      config.opposite_tunnel,
+                                      config.address,
+                                      config.address_surrounding,
+                                      config.address_non_adjacent,
+                                      config.internal_antennas)
+
+    def test_short(self):
+        self.assertEqual(uf.get_position_resume_index(["8"], ["8"]),
+                         (0, 0))
+
+    def test_last_not_internal(self):
+        out = uf.get_position_resume_index(["1", "8", "2"], ["8"])
+        self.assertEqual(out, (2, 0))
+
+    def test_last_internal(self):
+        out = uf.get_position_resume_index(["1", "2", "8", "8"], ["8"])
+        self.assertEqual(out, (1, 1))
+
+    def test_only_internal(self):
+        out = uf.get_position_resume_index(["8", "8"], ["8"])
+        self.assertEqual(out, (0, 1))
+
+    def test_two_internal_antennas(self):
+        out = uf.get_position_resume_index(["1", "8", "9"], ["8", "9"])
+        self.assertEqual(out, (2, 0))
+
+    def test_two_internal_antennas_run(self):
+        out = uf.get_position_resume_index(["1", "8", "9", "9"], ["8", "9"])
+        self.assertEqual(out, (2, 1))
+
+    def test_resumed_positions(self):
+        random.seed(1)
+        antennas = sorted(self.config.all_antennas)
+        for i in range(200):
+            length = random.randint(2, 12)
+            ants = [random.choice(antennas) for j in range(length)]
+            times = sorted([random.uniform(0, 30) for j in range(length)])
+            full = self.positions(times, ants)
+            for k in range(length + 1):
+                start, n_discard = uf.get_position_resume_index(
+                    ants[:k], self.config.internal_antennas)
+                old = self.positions(times[:k], ants[:k])
+                out = old[:len(old) - n_discard] +\
+                    self.positions(times[start:], ants[start:])
+                self.assertEqual(out, full)
+
+
 class TestDictToArray2D(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -2179,6 +2387,54 @@ class TestPrepareBinnedRegistrations(unittest.TestCase):
         data_keys = [["1_x", "2_x"],
                      [0.0]]
 
+
+class TestBinningEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_short_3_mice")
+        cls.data = Loader(path)
+        config = Timeline(path)
+        t_start, t_end = config.get_time_from_epoch("ALL")
+        cls.intervals = [(t, min(t + 1800, t_end))
+                         for t in np.arange(t_start, t_end, 1800).tolist()]
+        cls.intervals.append((t_start, t_start))
+        cls.mice = cls.data.mice
+
+    def test_bins(self):
+        phases, all_phases, labels, intervals = uf.get_bins(
+            Timeline(os.path.join(data_path, "weird_short_3_mice")),
+            48*3600., 12*3600., [0.0])
+        self.assertEqual(all_phases, ["1_x"])
+        self.assertEqual(phases, ["1_x_48.00h"])
+        self.assertEqual(len(intervals[0]), 1)
+
+    def test_prepare_data_bins(self):
+        out = uf.prepare_data_bins(self.data, self.mice, self.intervals)
+        for i, interval in enumerate(self.intervals):
+            self.assertEqual(out[i], uf.prepare_data(self.data, self.mice,
+                                                     interval))
+
+    def test_prepare_registrations_bins(self):
+        out = uf.prepare_registrations_bins(self.data, self.mice,
+                                            self.intervals)
+        for i, interval in enumerate(self.intervals):
+            self.assertEqual(out[i],
+                             uf.prepare_registrations(self.data, self.mice,
+                                                      *interval))
+
+    def test_times_antennas_bins(self):
+        out = uf.get_times_antennas_list_of_mice_bins(self.data, self.mice,
+                                                      self.intervals)
+        for i, interval in enumerate(self.intervals):
+            self.assertEqual(out[i],
+                             uf.get_times_antennas_list_of_mice(self.data,
+                                                                self.mice,
+                                                                *interval))
+
+    def test_empty(self):
+        self.assertEqual(uf.prepare_data_bins(self.data, self.mice, []), [])
+
+
 class TestMath(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
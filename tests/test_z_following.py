@@ -3,6 +3,7 @@ from __future__ import print_function, division, absolute_import
 import random
 import unittest
 import os
+import numpy as np
 from pyEcoHAB import following as fol
 from pyEcoHAB import utility_functions as uf
 from pyEcoHAB import Loader
@@ -77,6 +78,42 @@ class TestFollowing2ndMouseInPipe(unittest.TestCase):
         self.assertEqual(self.intervals3, [4, 6, 3])
 
 
+class TestFollowingSingleDirection(unittest.TestCase):
+    @staticmethod
+    def loop(intervals_m1, intervals_m2):
+        counter, time_together, intervals = 0, 0, []
+        for s1, e1 in zip(*intervals_m1):
+            for s2, e2 in zip(*intervals_m2):
+                if s1 <= s2 < e1 and e2 > e1:
+                    counter += 1
+                    time_together += e1 - s2
+                    intervals.append(e2 - s1)
+                    break
+        return counter, time_together, intervals
+
+    def test_same_as_loop(self):
+        rng = random.Random(7)
+        for i in range(50):
+            starts_1 = sorted(rng.uniform(0, 100) for j in range(20))
+            starts_2 = [rng.uniform(0, 100) for j in range(20)]
+            if i % 2:
+                starts_2.sort()
+            ints_1 = [starts_1, [s + rng.uniform(0, 5) for s in starts_1]]
+            ints_2 = [starts_2, [s + rng.uniform(0, 5) for s in starts_2]]
+            self.assertEqual(fol.following_single_direction(ints_1, ints_2),
+                             self.loop(ints_1, ints_2))
+
+    def test_first_passage(self):
+        out = fol.following_single_direction([[0, 10], [5, 12]],
+                                             [[4, 1, 2], [6, 7, 3]])
+        self.assertEqual(out, (1, 1, [6]))
+
+    def test_empty(self):
+        self.assertEqual(fol.following_single_direction([[], []],
+                                                        [[1], [2]]),
+                         (0, 0, []))
+
+
 class TestFollowingMatrices(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -322,6 +359,82 @@ class TestIntervalGeneration(unittest.TestCase):
         self.assertFalse(ints1 == ints2)
 
 
+class TestIntervalGenerationBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.t_starts = [3, 5, 10]
+        cls.t_ends = [4, 8, 12]
+        random_state = np.random.RandomState(1)
+        cls.starts, cls.ends = fol.generate_intervals_batch(cls.t_starts,
+                                                            cls.t_ends, 40,
+                                                            100, random_state)
+
+    def test_shape(self):
+        self.assertEqual(self.starts.shape, (100, 3))
+        self.assertEqual(self.ends.shape, (100, 3))
+
+    def test_durations(self):
+        durations = np.sort(self.ends - self.starts, axis=1)
+        self.assertTrue(np.allclose(durations, [[1, 2, 3]]))
+
+    def test_no_overlaps(self):
+        self.assertTrue((self.starts[:, 1:] >= self.ends[:, :-1]).all())
+
+    def test_in_duration(self):
+        self.assertTrue((self.starts >= 0).all())
+        self.assertTrue((self.ends <= 40).all())
+
+    def test_different(self):
+        self.assertFalse(np.array_equal(self.starts[0], self.starts[1]))
+
+    def test_too_long(self):
+        self.assertRaises(Exception, fol.generate_intervals_batch,
+                          self.t_starts, self.t_ends, 5, 10,
+                          np.random.RandomState(1))
+
+
+class TestFollowingBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        random_state = np.random.RandomState(2)
+        cls.ints1 = fol.generate_intervals_batch([0, 10, 20], [3, 15, 21],
+                                                 30, 200, random_state)
+        cls.ints2 = fol.generate_intervals_batch([0, 10], [4, 12],
+                                                 30, 200, random_state)
+
+    def test_same_as_single(self):
+        followings, times = fol.following_single_direction_batch(self.ints1,
+                                                                 self.ints2)
+        for i in range(200):
+            out = fol.following_single_direction(
+                [self.ints1[0][i], self.ints1[1][i]],
+                [self.ints2[0][i], self.ints2[1][i]])
+            self.assertEqual(followings[i], out[0])
+            self.assertAlmostEqual(times[i], out[1])
+
+    def test_empty(self):
+        empty = (np.zeros((200, 0)), np.zeros((200, 0)))
+        followings, times = fol.following_single_direction_batch(empty,
+                                                                 self.ints2)
+        self.assertEqual(followings.tolist(), [0]*200)
+        self.assertEqual(times.tolist(), [0]*200)
+
+    def test_bootstrap_seed(self):
+        directions = {
+            "mouse1": {"1 2": [[0, 10, 20], [3, 15, 21]]},
+            "mouse2": {"1 2": [[0, 10], [4, 12]]},
+        }
+        mice = ["mouse1", "mouse2"]
+        random.seed(5)
+        out1 = fol.bootstrap_single_phase(directions, mice, 0, 30, ["1 2"],
+                                          N=50)
+        random.seed(5)
+        out2 = fol.bootstrap_single_phase(directions, mice, 0, 30, ["1 2"],
+                                          N=50)
+        self.assertEqual(out1, out2)
+        self.assertEqual(len(out1[0]["mouse1"]["mouse2"]), 50)
+
+
 class TestExecution(unittest.TestCase):
     @classmethod
     def setUpClass(cls):